@@ -1,16 +1,18 @@
+import concurrent.futures
 import csv
 import datetime
 import logging
 import pathlib
-import warnings
+import tempfile
 from typing import Iterable, Mapping
 from collections import OrderedDict
 
-import arrow
-import dateutil.tz
+import requests.adapters
 
+import backfill
 import http_session
 import settings
+import timezones
 import utils
 from objects import Instrument, Data
 from settings import UrbanDialect
@@ -23,20 +25,24 @@ DESCRIPTION = """
 Aeroqual harvester for the Urban Flows Observatory.
 """
 
-# Ignore Arrow parsing version change warnings
-# https://github.com/arrow-py/arrow/issues/612
-warnings.simplefilter('ignore', arrow.factory.ArrowParseWarning)
-
 
 class AeroqualDataArgumentParser(utils.AeroqualArgumentParser):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.add_argument('-d', '--date', help='Get data for this day (UTC)', type=date, required=True)
-        self.add_argument('-o', '--output', help='Target CSV file path', type=pathlib.Path, required=True)
+        self.add_argument('-d', '--date', help='Get data for this day (UTC)', type=date)
+        self.add_argument('-s', '--start', help='Backfill: first day (UTC)', type=date)
+        self.add_argument('-n', '--end', help='Backfill: last day (UTC, inclusive)', type=date)
+        self.add_argument('-o', '--output', help='Target CSV file path (output directory when backfilling)',
+                          type=pathlib.Path, required=True)
+        self.add_argument('-k', '--checkpoint', type=pathlib.Path,
+                          help='Backfill: progress file path (default: {} in the output directory)'.format(
+                              settings.DEFAULT_CHECKPOINT))
         self.add_argument('-a', '--averaging', help='period in minutes to average data – minimum 1 minute',
                           type=int, default=settings.DEFAULT_AVERAGING_PERIOD)
         self.add_argument('-j', '--journal', action='store_true', help='Include journal entries')
+        self.add_argument('-w', '--workers', help='Number of instruments to download at once', type=int,
+                          default=settings.DEFAULT_WORKERS)
 
 
 def date(day: str) -> datetime.datetime:
@@ -46,43 +52,80 @@ def date(day: str) -> datetime.datetime:
     return datetime.datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=datetime.timezone.utc)
 
 
-def parse_timestamp(timestamp: str, timezone: str) -> datetime.datetime:
+def get_instrument_data(session, serial_number: str, start: datetime.datetime, end: datetime.datetime,
+                        averaging_period: int, include_journal: bool = False) -> list:
     """
-    Parse timestamp and convert to UTC
+    Get the details and the data for one instrument, in time order
     """
-    t = arrow.get(timestamp)
+    sensor = get_instrument(session, serial_number)
 
-    # Localise
-    # Extract time zone from string e.g. "(UTC+12:00) Auckland, Wellington" becomes "UTC+12:00"
-    timezone_string = timezone.partition(')')[0][1:]
-    timezone = dateutil.tz.gettz(timezone_string)
-    t = t.replace(tzinfo=timezone)
+    return query_instrument(session, serial_number, timezone=timezones.get_timezone(sensor['timeZone']), start=start,
+                            end=end, averaging_period=averaging_period, include_journal=include_journal)
 
-    return t.to('UTC')
 
+def get_instrument(session, serial_number: str) -> dict:
+    """
+    Get instrument details
+    """
+    LOGGER.info("Sensor serial number: %s", serial_number)
 
-def get_data(session, day: datetime.date, averaging_period: int, include_journal: bool = False) -> Rows:
-    start = datetime.datetime.combine(day, time=datetime.time.min)
-    end = start + datetime.timedelta(days=1)
+    inst = Instrument(serial_number)
+    sensor = inst.get(session)
 
-    for serial_number in Instrument.list(session):
-        LOGGER.info("Sensor serial number: %s", serial_number)
+    # Sensor details
+    for key, value in sensor.items():
+        LOGGER.debug("Sensor '%s' %s: %s", serial_number, key, value)
 
-        inst = Instrument(serial_number)
-        sensor = inst.get(session)
+    return sensor
 
-        # Sensor details
-        for key, value in sensor.items():
-            LOGGER.debug("Sensor '%s' %s: %s", serial_number, key, value)
 
-        data = Data(serial_number)
-        rows = data.query(session, start=start, end=end, averagingperiod=averaging_period,
-                          includejournal=include_journal)
+def query_instrument(session, serial_number: str, timezone: datetime.tzinfo, start: datetime.datetime,
+                     end: datetime.datetime, averaging_period: int, include_journal: bool = False) -> list:
+    """
+    Get the data for one instrument for a time period, in time order
+    """
+    data = Data(serial_number)
+    rows = data.query(session, start=start, end=end, averagingperiod=averaging_period,
+                      includejournal=include_journal)
 
-        for row in rows:
-            row = transform(row, timezone=sensor['timeZone'])
+    rows = list(rows)
+
+    # Convert the whole time column at once
+    for row, timestamp in zip(rows, timezones.convert_timestamps([row['Time'] for row in rows], timezone=timezone)):
+        row['Time'] = timestamp
+
+    rows = [transform(row) for row in rows]
+    rows.sort(key=lambda row: row['timestamp'])
+
+    return rows
+
+
+def get_data(session, day: datetime.date, averaging_period: int, include_journal: bool = False,
+             workers: int = settings.DEFAULT_WORKERS) -> Rows:
+    """
+    Download data for all instruments, several at once, and merge the rows in timestamp order.
+
+    The merge can only start once every instrument is done, so each instrument's rows are saved to a temporary part
+    file as soon as they arrive and merged from there, the same way the backfill merges its windows.
+    """
+    start = datetime.datetime.combine(day, time=datetime.time.min)
+    end = start + datetime.timedelta(days=1)
+
+    # Share the logged-in session (cookies and connection pool) between the threads
+    session.mount(session.BASE_URL, requests.adapters.HTTPAdapter(pool_maxsize=workers))
+
+    with tempfile.TemporaryDirectory() as directory:
+        def fetch(serial_number) -> pathlib.Path:
+            path = pathlib.Path(directory, '{}.csv'.format(serial_number))
+            backfill.save_part(path, get_instrument_data(session, serial_number, start=start, end=end,
+                                                         averaging_period=averaging_period,
+                                                         include_journal=include_journal))
+            return path
 
-            yield row
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            paths = list(executor.map(fetch, Instrument.list(session)))
+
+        yield from backfill.merge_parts(paths)
 
 
 def write_csv(path: pathlib.Path, rows: Rows):
@@ -105,9 +148,7 @@ def write_csv(path: pathlib.Path, rows: Rows):
         LOGGER.info("Wrote %s rows to '%s'", row_count, file.name)
 
 
-def transform(row: dict, timezone: str = None) -> dict:
-    row['Time'] = parse_timestamp(row['Time'], timezone=timezone)
-
+def transform(row: dict) -> dict:
     # Rename columns
     row = OrderedDict(((settings.RENAME_COLUMNS.get(key, key), value) for key, value in row.items()))
 
@@ -117,14 +158,53 @@ def transform(row: dict, timezone: str = None) -> dict:
     return row
 
 
+def run_backfill(session, args) -> list:
+    """
+    Download data for a range of days in windows, writing one file per day to the output directory.
+
+    :returns: Days that are not complete
+    """
+    checkpoint = backfill.Checkpoint(args.checkpoint or args.output.joinpath(settings.DEFAULT_CHECKPOINT),
+                                     directory=args.output)
+    checkpoint.load()
+
+    # Share the logged-in session (cookies and connection pool) between the threads
+    session.mount(session.BASE_URL, requests.adapters.HTTPAdapter(pool_maxsize=args.workers))
+
+    # Get each instrument's time zone once
+    instruments = {serial_number: timezones.get_timezone(get_instrument(session, serial_number)['timeZone'])
+                   for serial_number in Instrument.list(session)}
+
+    def fetch(serial_number, start, end):
+        return query_instrument(session, serial_number, timezone=instruments[serial_number], start=start, end=end,
+                                averaging_period=args.averaging, include_journal=args.journal)
+
+    engine = backfill.Backfill(directory=args.output, checkpoint=checkpoint, fetch=fetch, write=write_csv,
+                               workers=args.workers)
+
+    return engine.run(instruments.keys(), days=backfill.date_range(args.start, args.end),
+                      length=backfill.window_length(args.averaging))
+
+
 def main():
     parser = AeroqualDataArgumentParser(description=DESCRIPTION)
     args = parser.parse_args()
     utils.configure_logging(verbose=args.verbose, debug=args.debug, error=args.error)
 
+    if bool(args.start) != bool(args.end):
+        parser.error('--start and --end must be used together')
+    if not (args.date or args.start):
+        parser.error('Either --date or --start and --end is required')
+
     session = http_session.AeroqualSession(config_file=args.config)
 
-    rows = get_data(session=session, day=args.date, averaging_period=args.averaging, include_journal=args.journal)
+    if args.start:
+        if run_backfill(session, args):
+            raise SystemExit(1)
+        return
+
+    rows = get_data(session=session, day=args.date, averaging_period=args.averaging, include_journal=args.journal,
+                    workers=args.workers)
     write_csv(rows=rows, path=args.output)
 
 
@@ -0,0 +1,228 @@
+"""
+Resumable backfill of Aeroqual data over a range of dates
+
+Each day is split into time windows for each instrument so that no single request returns too many rows. The windows
+are downloaded concurrently and each one is saved to a temporary part file and recorded in a checkpoint file. When
+all the windows for a day are complete they're merged into that day's output file. If the backfill is interrupted,
+running it again skips the windows and days that are already complete.
+"""
+
+import concurrent.futures
+import csv
+import datetime
+import heapq
+import json
+import logging
+import math
+import os
+import pathlib
+import shutil
+
+import settings
+
+LOGGER = logging.getLogger(__name__)
+
+
+def window_length(averaging_period: int, rows: int = settings.WINDOW_ROWS) -> datetime.timedelta:
+    """
+    Split a day into equal windows that each contain at most the specified number of rows
+
+    :param averaging_period: minutes
+    """
+    minutes_per_day = 24 * 60
+    windows_per_day = math.ceil(minutes_per_day / (rows * averaging_period))
+    return datetime.timedelta(days=1) / windows_per_day
+
+
+def date_range(start: datetime.datetime, end: datetime.datetime) -> iter:
+    """
+    Generate midnight on each day from the start date to the end date (inclusive), without a time zone like the
+    daily harvest, because the API expects times in each instrument's local time
+    """
+    day = datetime.datetime.combine(start.date(), datetime.time.min)
+    end = datetime.datetime.combine(end.date(), datetime.time.min)
+    while day <= end:
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+def day_windows(day: datetime.datetime, length: datetime.timedelta) -> iter:
+    """Generate the start and end time of each window in a day"""
+    start = day
+    end = day + datetime.timedelta(days=1)
+    while start < end:
+        yield start, min(start + length, end)
+        start += length
+
+
+def save_part(path: pathlib.Path, rows: list):
+    """Write rows (in time order) to a part file, which is empty if there aren't any rows"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open('w', newline='') as file:
+        if rows:
+            writer = csv.DictWriter(file, fieldnames=rows[0].keys())
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def read_part(path: pathlib.Path) -> iter:
+    with path.open(newline='') as file:
+        yield from csv.DictReader(file)
+
+
+def merge_parts(paths) -> iter:
+    """Combine part files into one sequence of rows in timestamp order, reading one row from each file at a time"""
+    return heapq.merge(*map(read_part, paths), key=lambda row: row['timestamp'])
+
+
+class Checkpoint:
+    """
+    Record of the completed windows and days for one output directory, saved to a JSON file
+    """
+
+    def __init__(self, path: pathlib.Path, directory: pathlib.Path):
+        """
+        :param directory: Output directory that the windows and days were written to
+        """
+        self.path = pathlib.Path(path)
+        self.directory = str(pathlib.Path(directory).resolve())
+        self.windows = set()
+        self.days = set()
+
+    def load(self):
+        try:
+            with self.path.open() as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return
+
+        # The progress of a backfill into a different directory doesn't apply
+        if data.get('directory') != self.directory:
+            LOGGER.warning("Ignoring '%s' (progress for output directory '%s')", self.path, data.get('directory'))
+            return
+
+        self.windows = set(data['windows'])
+        self.days = set(data['days'])
+        LOGGER.info("Resuming from '%s': %s days and %s windows complete", self.path, len(self.days),
+                    len(self.windows))
+
+    def save(self):
+        """Record progress (called after every window, so the file is swapped in whole rather than rewritten)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with temp_path.open('w') as file:
+            json.dump(dict(directory=self.directory, windows=sorted(self.windows), days=sorted(self.days)), file,
+                      indent=2)
+        os.replace(str(temp_path), str(self.path))
+
+    @staticmethod
+    def key(serial_number: str, start: datetime.datetime) -> str:
+        return '{}/{}'.format(serial_number, start.isoformat())
+
+
+class Backfill:
+    """
+    Download each instrument's data in windows and write one file per day
+    """
+
+    def __init__(self, directory: pathlib.Path, checkpoint: Checkpoint, fetch, write, workers: int):
+        """
+        :param directory: Output directory
+        :param fetch: Function fetch(serial_number, start, end) that returns rows in time order
+        :param write: Function write(path, rows) that writes rows to a CSV file
+        :param workers: Maximum number of windows to download at once
+        """
+        self.directory = pathlib.Path(directory)
+        self.checkpoint = checkpoint
+        self.fetch = fetch
+        self.write = write
+        self.workers = workers
+
+    def parts_dir(self, day: datetime.datetime) -> pathlib.Path:
+        return self.directory.joinpath('.parts', day.date().isoformat())
+
+    def part_path(self, day: datetime.datetime, key: str) -> pathlib.Path:
+        return self.parts_dir(day).joinpath('{}.csv'.format(key.replace('/', '_').replace(':', '')))
+
+    def output_path(self, day: datetime.datetime) -> pathlib.Path:
+        return self.directory.joinpath('{}.csv'.format(day.date().isoformat()))
+
+    def merge_day(self, day: datetime.datetime):
+        """Combine the windows for all instruments into one file in timestamp order"""
+        parts = sorted(self.parts_dir(day).glob('*.csv')) if self.parts_dir(day).exists() else list()
+        rows = merge_parts(parts)
+
+        self.write(self.output_path(day), rows)
+
+        # Clean up
+        shutil.rmtree(str(self.parts_dir(day)), ignore_errors=True)
+        prefix = '/' + day.date().isoformat()
+        self.checkpoint.windows = {key for key in self.checkpoint.windows if prefix not in key}
+        self.checkpoint.days.add(day.date().isoformat())
+        self.checkpoint.save()
+
+        LOGGER.info("Completed %s", day.date())
+
+    def run(self, instruments, days, length: datetime.timedelta) -> list:
+        """
+        :param instruments: Serial numbers
+        :param days: Dates to download (midnight UTC)
+        :param length: Window duration
+        :returns: Days that are not complete
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # Windows remaining for each day
+        remaining = dict()
+        tasks = dict()
+
+        for day in days:
+            if day.date().isoformat() in self.checkpoint.days:
+                LOGGER.info("Skipping %s (already complete)", day.date())
+                continue
+
+            remaining[day] = set()
+            for serial_number in instruments:
+                for start, end in day_windows(day, length):
+                    key = self.checkpoint.key(serial_number, start)
+                    if key not in self.checkpoint.windows:
+                        remaining[day].add(key)
+                        tasks[key] = day, serial_number, start, end
+
+        # Interrupted while merging
+        for day, keys in remaining.items():
+            if not keys:
+                self.merge_day(day)
+
+        LOGGER.info("%s windows to download", len(tasks))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self.fetch, serial_number, start, end): key
+                for key, (day, serial_number, start, end) in tasks.items()
+            }
+
+            for future in concurrent.futures.as_completed(futures):
+                key = futures[future]
+                day = tasks[key][0]
+
+                try:
+                    rows = future.result()
+                except Exception as error:
+                    LOGGER.exception(error)
+                    LOGGER.error("Failed window %s", key)
+                    continue
+
+                save_part(self.part_path(day, key), rows)
+                self.checkpoint.windows.add(key)
+                self.checkpoint.save()
+
+                remaining[day].discard(key)
+                if not remaining[day]:
+                    self.merge_day(day)
+
+        incomplete = [day for day, keys in remaining.items() if keys]
+        for day in incomplete:
+            LOGGER.error("Incomplete %s: %s windows failed", day.date(), len(remaining[day]))
+
+        return incomplete
@@ -0,0 +1,62 @@
+"""
+Compare the row-by-row and the column timestamp conversion for one day of 1-minute data, including days when the
+clocks change.
+
+Usage:
+python benchmark.py
+"""
+
+import datetime
+import timeit
+
+import arrow
+import dateutil.tz
+
+import timezones
+
+# (Aeroqual time zone label, equivalent time zone, day)
+CASES = (
+    ('(UTC+12:00) Auckland, Wellington', None, datetime.date(2020, 5, 1)),
+    ('(UTC+00:00) Dublin, Edinburgh, Lisbon, London', None, datetime.date(2020, 5, 1)),
+    # Clocks go forward and back
+    ('(UTC+00:00) Dublin, Edinburgh, Lisbon, London', 'Europe/London', datetime.date(2020, 3, 29)),
+    ('(UTC+00:00) Dublin, Edinburgh, Lisbon, London', 'Europe/London', datetime.date(2020, 10, 25)),
+)
+
+REPEAT = 3
+
+
+def minutes(day: datetime.date) -> list:
+    start = datetime.datetime.combine(day, datetime.time.min)
+    return [(start + datetime.timedelta(minutes=i)).isoformat() for i in range(24 * 60)]
+
+
+def per_row(timestamps: list, label: str, timezone: datetime.tzinfo) -> list:
+    """The original conversion, one row at a time (optionally with a time zone that has daylight saving time)"""
+    if timezone is None:
+        return [str(timezones.parse_timestamp(t, timezone=label)) for t in timestamps]
+
+    return [str(arrow.get(t).replace(tzinfo=timezone).to('UTC')) for t in timestamps]
+
+
+def main():
+    for label, name, day in CASES:
+        timestamps = minutes(day)
+        timezone = dateutil.tz.gettz(name) if name else timezones.get_timezone(label)
+        per_row_timezone = timezone if name else None
+
+        expected = per_row(timestamps, label=label, timezone=per_row_timezone)
+        actual = timezones.convert_timestamps(timestamps, timezone=timezone)
+        mismatches = sum(a != b for a, b in zip(actual, expected))
+
+        old = min(timeit.repeat(lambda: per_row(timestamps, label, per_row_timezone), number=1,
+                                repeat=REPEAT))
+        new = min(timeit.repeat(lambda: timezones.convert_timestamps(timestamps, timezone), number=1,
+                                repeat=REPEAT))
+
+        print("{day} {zone}: per-row {old:.4f}s, column {new:.4f}s ({speedup:.0f}x), {mismatches} mismatches".format(
+            day=day, zone=name or label, old=old, new=new, speedup=old / new, mismatches=mismatches))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,9 @@
+import http
+import json
 import logging
+import os
+import threading
+import time
 import urllib.parse
 import pathlib
 import configparser
@@ -15,12 +20,20 @@ LOGGER = logging.getLogger(__name__)
 class AeroqualSession(requests.Session):
     BASE_URL = settings.API_BASE_URL
 
-    def __init__(self, config_file: pathlib.Path):
+    def __init__(self, config_file: pathlib.Path, cache_file: pathlib.Path = settings.DEFAULT_SESSION_CACHE):
+        """
+        :param config_file: Credentials
+        :param cache_file: Login cookies are saved here and re-used until they expire
+        """
         super().__init__()
         self.config_file = pathlib.Path(config_file)
         self._config = None
+        self.cache_file = pathlib.Path(cache_file) if cache_file else None
+        self._login_lock = threading.Lock()
+        self._login_time = 0.0
 
-        self.login()
+        if not self.load_cookies():
+            self.login()
 
     @classmethod
     def build_url(cls, endpoint: str) -> str:
@@ -58,12 +71,77 @@ class AeroqualSession(requests.Session):
         """
         endpoint = 'account/login'
         url = self.build_url(endpoint)
-        return self.post(url, data=dict(UserName=self.username, Password=self.password))
+        LOGGER.info("Logging in as '%s'", self.username)
+        self.cookies.clear()
+        response = self.post(url, data=dict(UserName=self.username, Password=self.password))
+        self._login_time = time.monotonic()
+        self.save_cookies()
+        return response
+
+    def load_cookies(self) -> bool:
+        """
+        Use the cookies from a previous login if they haven't expired
+
+        :returns: Whether valid cookies were loaded
+        """
+        if not self.cache_file:
+            return False
+
+        try:
+            with self.cache_file.open() as file:
+                cache = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return False
+
+        now = time.time()
+        if cache.get('username') != self.username or now > cache['saved'] + settings.SESSION_TTL:
+            return False
+
+        cookies = cache['cookies']
+        if not cookies or any(cookie['expires'] and now > cookie['expires'] for cookie in cookies):
+            return False
+
+        for cookie in cookies:
+            self.cookies.set(**cookie)
+
+        LOGGER.info("Loaded login cookies from '%s'", self.cache_file)
+        return True
+
+    def save_cookies(self):
+        """Save login cookies to a file that only the current user may read"""
+        if not self.cache_file:
+            return
+
+        cache = dict(
+            username=self.username,
+            saved=time.time(),
+            cookies=[
+                dict(name=cookie.name, value=cookie.value, domain=cookie.domain, path=cookie.path,
+                     expires=cookie.expires)
+                for cookie in self.cookies
+            ],
+        )
+
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(os.open(str(self.cache_file), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as file:
+            json.dump(cache, file)
+
+        LOGGER.debug("Saved login cookies to '%s'", self.cache_file)
 
     def request(self, *args, **kwargs):
         # Wrap request, but raise errors
         response = super().request(*args, **kwargs)
 
+        # Log in again if the cached cookies have expired
+        if response.status_code == http.HTTPStatus.UNAUTHORIZED and not response.url.endswith('account/login'):
+            LOGGER.info("Login expired")
+            failed = time.monotonic()
+            with self._login_lock:
+                # Another thread may have logged in already
+                if self._login_time < failed:
+                    self.login()
+            response = super().request(*args, **kwargs)
+
         for header, value in response.request.headers.items():
             LOGGER.debug("REQUEST %s: %s", header, value)
         for header, value in response.headers.items():
@@ -4,6 +4,10 @@ import pathlib
 CONFIG_DIR = pathlib.Path.home().joinpath('configs')
 DEFAULT_CONFIG_FILE = CONFIG_DIR.joinpath('aeroqual.cfg')
 
+# Re-use login cookies between runs
+DEFAULT_SESSION_CACHE = CONFIG_DIR.joinpath('aeroqual_session.json')
+SESSION_TTL = 60 * 60  # seconds
+
 LOGGING = dict(
     # https://docs.python.org/3.8/library/logging.html#logrecord-attributes
     format='%(asctime)s %(filename)s:%(lineno)s %(levelname)s %(message)s',
@@ -11,6 +15,13 @@ LOGGING = dict(
 
 DEFAULT_AVERAGING_PERIOD = 1
 
+# Number of instruments to download at once
+DEFAULT_WORKERS = 4
+
+# Backfill: maximum number of rows to request at once
+WINDOW_ROWS = 360
+DEFAULT_CHECKPOINT = 'checkpoint.json'  # in the output directory
+
 # Rename metrics from the values on the remote API to the UFO standard
 RENAME_COLUMNS = {
     'Time': 'timestamp',
@@ -0,0 +1,72 @@
+"""
+Instrument time zones
+
+The Aeroqual API returns timestamps in each instrument's local time, which are converted to UTC.
+"""
+
+import datetime
+import functools
+import warnings
+
+import arrow
+import dateutil.tz
+import numpy
+import pandas
+
+try:
+    # Raised by older versions of pandas, which depend on pytz
+    from pytz import AmbiguousTimeError
+except ImportError:
+    AmbiguousTimeError = ValueError
+
+# Ignore Arrow parsing version change warnings
+# https://github.com/arrow-py/arrow/issues/612
+warnings.simplefilter('ignore', arrow.factory.ArrowParseWarning)
+
+
+def parse_timestamp(timestamp: str, timezone: str) -> datetime.datetime:
+    """
+    Parse timestamp and convert to UTC (one row at a time, see convert_timestamps)
+    """
+    t = arrow.get(timestamp)
+
+    # Localise
+    t = t.replace(tzinfo=get_timezone(timezone))
+
+    return t.to('UTC')
+
+
+@functools.lru_cache()
+def get_timezone(timezone: str) -> datetime.tzinfo:
+    """
+    Resolve an instrument time zone label
+
+    Extract time zone from string e.g. "(UTC+12:00) Auckland, Wellington" becomes "UTC+12:00"
+    """
+    timezone_string = timezone.partition(')')[0][1:]
+    return dateutil.tz.gettz(timezone_string)
+
+
+def convert_timestamps(timestamps: list, timezone: datetime.tzinfo) -> list:
+    """
+    Convert a column of local timestamps to UTC ISO 8601 strings in one pass
+
+    :param timestamps: Local time strings e.g. 2020-03-29T01:30:00
+    :param timezone: Instrument time zone
+    """
+    if not timestamps:
+        return list()
+
+    times = pandas.DatetimeIndex(pandas.to_datetime(timestamps))
+
+    # Times that occur twice when the clocks go back are inferred from the order of the data if possible, otherwise
+    # assume daylight saving time (the first occurrence) like the row-by-row conversion. Times that are skipped when
+    # the clocks go forward are also treated as daylight saving time.
+    nonexistent = pandas.Timedelta(hours=-1)
+    try:
+        times = times.tz_localize(timezone, ambiguous='infer', nonexistent=nonexistent)
+    # The order of the data doesn't show which times are daylight saving time
+    except (ValueError, AmbiguousTimeError):
+        times = times.tz_localize(timezone, ambiguous=numpy.ones(len(times), dtype=bool), nonexistent=nonexistent)
+
+    return list(times.tz_convert('UTC').strftime('%Y-%m-%dT%H:%M:%S+00:00'))
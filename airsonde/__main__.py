@@ -1,10 +1,18 @@
 import argparse
+import concurrent.futures
+import heapq
+import json
 import logging
+import operator
+import queue
+import threading
 import datetime
 import csv
 import pathlib
+import tempfile
+from typing import TextIO
 
-from collections import OrderedDict
+import requests.adapters
 
 import utils
 import settings
@@ -39,6 +47,10 @@ def get_args() -> argparse.Namespace:
     parser.add_argument('-o', '--output', help='Path of output file', required=True, type=pathlib.Path)
     parser.add_argument('-a', '--average', help='Time frequency in seconds', type=int,
                         default=settings.DEFAULT_AVERAGING_TIME)
+    parser.add_argument('-w', '--workers', help='Number of devices to download at once', type=int,
+                        default=settings.DEFAULT_WORKERS)
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help='Decode data as it is received from all devices at once to minimise memory usage')
 
     return parser.parse_args()
 
@@ -49,16 +61,29 @@ def parse_timestamp(timestamp: int) -> str:
     return t.isoformat()
 
 
-def transform(row: dict) -> dict:
-    """Clean a row of data"""
-    # Rename metrics
-    row = {settings.METRICS[key]: value for key, value in row.items()}
+def compile_columns(metrics: dict, columns) -> tuple:
+    """
+    Find the data label for each output column (the reverse of the metric renaming) so that rows can be built
+    without renaming every key of every data point.
+    """
+    labels = {metric: label for label, metric in metrics.items()}
+    return tuple(labels[column] for column in columns)
 
-    # Leave timestamp in Unix format
-    # row['timestamp'] = parse_timestamp(row['timestamp'])
 
-    # Preserve column order
-    return OrderedDict(row)
+# Data labels in the order of the output columns
+COLUMN_LABELS = compile_columns(settings.METRICS, settings.OUTPUT_COLUMNS)
+
+# Position of the time column in an output row
+get_timestamp = operator.itemgetter(settings.OUTPUT_COLUMNS.index('timestamp'))
+
+
+def transform(point: dict, device_id: str) -> tuple:
+    """Build an output row (in column order) from a data point"""
+    row = point['payload']['d']
+    row['sensor'] = device_id
+
+    # Leave timestamp in Unix format
+    return tuple(map(row.get, COLUMN_LABELS))
 
 
 def write_csv(path: pathlib.Path, rows):
@@ -66,7 +91,7 @@ def write_csv(path: pathlib.Path, rows):
     LOGGER.info('CSV headers %s', headers)
     row_count = 0
     with path.open('w', newline='\n') as file:
-        writer = csv.DictWriter(file, fieldnames=headers, dialect=UrbanDialect)
+        writer = csv.writer(file, dialect=UrbanDialect)
 
         for row in rows:
             writer.writerow(row)
@@ -79,23 +104,119 @@ def write_csv(path: pathlib.Path, rows):
         LOGGER.info("Deleted '%s'", file.name)
 
 
-def get_data(session, start, end, average) -> iter:
-    # Iterate over all available devices
-    for device in Device.list(session):
+def get_device_data(session, device_id: str, start, end, average) -> list:
+    """
+    Run query against this device and return the data points in time order
+    """
+    data = Data.analytics(session, device_id, start, end, average)
+    LOGGER.info("Retrieved %s rows for device %s", len(data), device_id)
+
+    data.sort(key=lambda point: point['payload']['d']['t'])
+
+    return data
+
+
+def iter_rows(device_id: str, data) -> iter:
+    """
+    Generate data rows for one device
+    """
+    for point in data:
+        yield transform(point, device_id)
+
+
+def save_points(data: list) -> TextIO:
+    """
+    Write a device's data points to a temporary file as JSON lines, the same form the analytics API returned them in
+    """
+    file = tempfile.TemporaryFile('w+')
+    for point in data:
+        file.write(json.dumps(point))
+        file.write('\n')
+    file.seek(0)
+    return file
+
+
+def load_points(file: TextIO) -> iter:
+    """Decode the data points written by save_points, one line at a time"""
+    with file:
+        for line in file:
+            yield json.loads(line)
+
+
+def get_data(session, start, end, average, workers: int = settings.DEFAULT_WORKERS) -> iter:
+    """
+    Query all available devices, several at once, and merge their data in time order.
+
+    A device's analytics query returns all of its data points at once, so only the devices still being queried are
+    held in memory; finished devices wait on disk until the merge. (The --stream option reads the data as it arrives
+    instead, without any temporary files.)
+    """
+    devices = Device.list(session)
+    for device in devices:
         LOGGER.info("DEVICE %s", device)
 
-        # Run query against this device
-        row_count = 0
-        for data in Data.analytics(session, device['deviceId'], start, end, average):
-            row_count += 1
-            # Build a data row
-            row = data['payload']['d'].copy()
+    # Share the authenticated session's connection pool between the threads, which each send several requests at once
+    pool_size = workers * settings.ANALYTICS_WORKERS
+    session.mount(session.BASE_URL, requests.adapters.HTTPAdapter(pool_maxsize=pool_size))
+
+    def fetch(device_id):
+        return save_points(get_device_data(session, device_id, start, end, average))
 
-            row['sensor'] = device['deviceId']
+    device_ids = [device['deviceId'] for device in devices]
 
-            yield row
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        files = list(executor.map(fetch, device_ids))
 
-        LOGGER.info("Retrieved %s rows", row_count)
+    streams = [iter_rows(device_id, load_points(file)) for device_id, file in zip(device_ids, files)]
+
+    yield from heapq.merge(*streams, key=get_timestamp)
+
+
+def buffer_in_background(iterable, maxsize: int) -> iter:
+    """
+    Iterate in a separate thread, holding at most the specified number of items that haven't been consumed yet
+    """
+    items = queue.Queue(maxsize=maxsize)
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put(item)
+        except Exception as error:
+            items.put(error)
+        items.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    while True:
+        item = items.get()
+        if item is done:
+            break
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def stream_data(session, start, end, average) -> iter:
+    """
+    Stream data from all devices at once and merge it in time order as it arrives
+    """
+    devices = Device.list(session)
+    for device in devices:
+        LOGGER.info("DEVICE %s", device)
+
+    # One open connection per device
+    session.mount(session.BASE_URL, requests.adapters.HTTPAdapter(pool_maxsize=max(len(devices), 1)))
+
+    streams = [
+        buffer_in_background(
+            iter_rows(device['deviceId'], Data.iter_analytics(session, device['deviceId'], start, end, average)),
+            maxsize=settings.STREAM_BUFFER)
+        for device in devices
+    ]
+
+    yield from heapq.merge(*streams, key=get_timestamp)
 
 
 def get_time_range(date: datetime.date) -> tuple:
@@ -111,10 +232,6 @@ def get_time_range(date: datetime.date) -> tuple:
     return start, end
 
 
-def sort(rows: iter, key: str) -> list:
-    return sorted(rows, key=lambda row: row[key])
-
-
 def main():
     args = get_args()
     utils.configure_logging(verbose=args.verbose, error=args.error, debug=args.debug)
@@ -125,13 +242,10 @@ def main():
 
     # Run query
     start, end = get_time_range(args.date)
-    rows = get_data(session, start, end, average)
-
-    # Clean up
-    rows = (transform(row) for row in rows)
-
-    # Sort chronologically
-    rows = sort(rows, key='timestamp')
+    if args.stream:
+        rows = stream_data(session, start, end, average)
+    else:
+        rows = get_data(session, start, end, average, workers=args.workers)
 
     # Save output file
     write_csv(args.output, rows=rows)
@@ -1,7 +1,15 @@
+import http
+import json
 import logging
+import os
+import pathlib
+import threading
+import time
 import urllib.parse
 import requests
 
+import settings
+
 USER_AGENT = 'Urban Flows Observatory'
 
 LOGGER = logging.getLogger(__name__)
@@ -15,17 +23,38 @@ class OizumSession(requests.Session):
     """
     BASE_URL = 'https://production.oizom.com/v1/'
 
-    def __init__(self, client_id, client_secret):
+    def __init__(self, client_id, client_secret, cache_file: pathlib.Path = settings.DEFAULT_TOKEN_CACHE):
+        """
+        :param cache_file: The access token is saved here and re-used until it expires
+        """
         super().__init__()
         self.client_id = client_id
         self.client_secret = client_secret
+        self.cache_file = pathlib.Path(cache_file) if cache_file else None
+        self._auth_lock = threading.Lock()
+        self._auth_time = 0.0
         self.headers.update({'User-Agent': USER_AGENT})
+
+        self._access_token = self.load_token()
         self.authenticate()
 
     def request(self, *args, **kwargs):
         """Wrapper for all HTTP requests"""
         response = super().request(*args, **kwargs)
 
+        # Get a new token if the cached one has expired
+        if response.status_code == http.HTTPStatus.UNAUTHORIZED and not response.url.endswith('oauth2/token'):
+            LOGGER.info("Access token expired")
+            failed = time.monotonic()
+            with self._auth_lock:
+                # Another thread may have authenticated already
+                if self._auth_time < failed:
+                    self._access_token = None
+                    self.authenticate()
+
+            # Send the new token (in the session headers)
+            response = super().request(*args, **kwargs)
+
         # Log request headers
         for header, value in response.request.headers.items():
             LOGGER.debug("REQUEST %s: %s", header, value)
@@ -50,8 +79,28 @@ class OizumSession(requests.Session):
         response = self.request(url=url, method='post' if post else 'get', **kwargs)
         return response.json()
 
+    def call_iter(self, endpoint: str, **kwargs) -> iter:
+        """
+        Call an API endpoint that returns a JSON array and generate the items as they are received, without loading
+        the whole response into memory
+        """
+        url = urllib.parse.urljoin(self.BASE_URL, endpoint)
+        with self.request(url=url, method='get', stream=True, **kwargs) as response:
+            if response.encoding is None:
+                response.encoding = 'utf-8'
+
+            yield from iter_json_array(response.iter_content(chunk_size=settings.STREAM_CHUNK_SIZE,
+                                                             decode_unicode=True))
+
     @property
     def access_token(self) -> str:
+        """The current access token (only requested from the API if there isn't one already)"""
+        if not self._access_token:
+            self._access_token = self.get_access_token()
+        return self._access_token
+
+    def get_access_token(self) -> str:
+        """Request a new access token and save it for re-use"""
         payload = dict(
             client_id=self.client_id,
             client_secret=self.client_secret,
@@ -59,8 +108,47 @@ class OizumSession(requests.Session):
             scope='view_data',
         )
         data = self.call('oauth2/token', json=payload, post=True)
+        self._auth_time = time.monotonic()
+
+        self.save_token(data['access_token'], expires_in=data.get('expires_in', settings.TOKEN_TTL))
+
         return data['access_token']
 
+    def load_token(self) -> str:
+        """Get the access token from a previous run if it hasn't expired"""
+        if not self.cache_file:
+            return None
+
+        try:
+            with self.cache_file.open() as file:
+                cache = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if cache.get('client_id') != self.client_id or time.time() > cache['expires']:
+            return None
+
+        LOGGER.info("Loaded access token from '%s'", self.cache_file)
+        return cache['access_token']
+
+    def save_token(self, access_token: str, expires_in: float):
+        """Save the access token to a file that only the current user may read"""
+        if not self.cache_file:
+            return
+
+        cache = dict(
+            client_id=self.client_id,
+            access_token=access_token,
+            # Allow a margin for clock differences
+            expires=time.time() + float(expires_in) - settings.TOKEN_EXPIRY_MARGIN,
+        )
+
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(os.open(str(self.cache_file), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as file:
+            json.dump(cache, file)
+
+        LOGGER.debug("Saved access token to '%s'", self.cache_file)
+
     def authenticate(self):
         """Generate an login token"""
 
@@ -69,3 +157,51 @@ class OizumSession(requests.Session):
             'ClientId': self.client_id,
         }
         self.headers.update(headers)
+
+
+def iter_json_array(chunks) -> iter:
+    """
+    Incrementally decode the items of a JSON array from pieces of text
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+
+    for chunk in chunks:
+        buffer += chunk
+        position = 0
+
+        while True:
+            # Skip whitespace and separators
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError('Expected a JSON array')
+                started = True
+                position += 1
+                continue
+
+            # End of array
+            if buffer[position] == ']':
+                return
+
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Wait for the rest of the item
+                break
+
+            # A number may not be complete until the next separator is received
+            if not isinstance(item, (dict, list, str)) and buffer[end:].lstrip()[:1] not in {',', ']'}:
+                break
+
+            yield item
+            position = end
+
+        buffer = buffer[position:]
+
+    raise ValueError('Incomplete JSON array')
@@ -1,5 +1,11 @@
+import concurrent.futures
+import logging
 from datetime import datetime, timedelta
 
+import settings
+
+LOGGER = logging.getLogger(__name__)
+
 
 class OizomObject:
     """
@@ -17,6 +23,10 @@ class OizomObject:
     def build_endpoint(*parts):
         return '/'.join(parts)
 
+    @classmethod
+    def call_iter(cls, session, endpoint, **kwargs):
+        return session.call_iter(cls.build_endpoint(cls.EDGE, endpoint), **kwargs)
+
     @classmethod
     def list(cls, session):
         return session.call(cls.EDGE)
@@ -57,12 +67,73 @@ class Data(OizomObject):
     def _analytics(cls, session, device_id, gte: int, lte: int, avg: int):
         return cls.call(session, cls.build_endpoint('analytics', device_id), params=dict(gte=gte, lte=lte, avg=avg))
 
+    @staticmethod
+    def windows(gte: int, lte: int, avg: int, max_points: int = settings.ANALYTICS_MAX_POINTS) -> list:
+        """
+        Split a time range into sub-ranges that each contain at most the specified number of data points
+
+        :returns: (gte, lte) Unix timestamps, which overlap at the boundaries because both are inclusive
+        """
+        size = max(max_points * avg, 1)
+        starts = range(gte, lte, size)
+        return [(s, min(s + size, lte)) for s in starts] or [(gte, lte)]
+
     @classmethod
-    def analytics(cls, session, device_id, start: datetime, end: datetime, average: timedelta):
+    def analytics(cls, session, device_id, start: datetime, end: datetime, average: timedelta,
+                  workers: int = settings.ANALYTICS_WORKERS) -> list:
+        """
+        Get averaged data for a device. Long time ranges are split into several smaller requests that are sent at
+        the same time and the results are combined in time order.
+        """
         gte = int(start.timestamp())
         lte = int(end.timestamp())
         avg = int(average.total_seconds())
-        return cls._analytics(session, device_id, gte, lte, avg)
+
+        windows = cls.windows(gte, lte, avg)
+        if len(windows) == 1:
+            return cls._analytics(session, device_id, gte, lte, avg)
+
+        LOGGER.debug("Device %s: %s windows", device_id, len(windows))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(lambda window: cls._analytics(session, device_id, *window, avg), windows)
+
+            # Stitch the windows together, skipping data points that are repeated at the boundaries
+            data = list()
+            latest = None
+            for result in results:
+                for point in sorted(result, key=cls.timestamp):
+                    if latest is None or cls.timestamp(point) > latest:
+                        data.append(point)
+                        latest = cls.timestamp(point)
+
+        return data
+
+    @classmethod
+    def iter_analytics(cls, session, device_id, start: datetime, end: datetime, average: timedelta) -> iter:
+        """
+        Stream averaged data for a device, decoding each data point as it's received. Long time ranges are split
+        into windows which are requested one after another. Each window is sorted before it's yielded, like
+        analytics(), so at most one window is held in memory.
+        """
+        gte = int(start.timestamp())
+        lte = int(end.timestamp())
+        avg = int(average.total_seconds())
+
+        latest = None
+        for window_gte, window_lte in cls.windows(gte, lte, avg):
+            params = dict(gte=window_gte, lte=window_lte, avg=avg)
+            window = cls.call_iter(session, cls.build_endpoint('analytics', device_id), params=params)
+
+            for point in sorted(window, key=cls.timestamp):
+                # Skip data points that are repeated at the window boundaries
+                if latest is None or cls.timestamp(point) > latest:
+                    latest = cls.timestamp(point)
+                    yield point
+
+    @staticmethod
+    def timestamp(point: dict) -> int:
+        return point['payload']['d']['t']
 
 
 class Alert(OizomObject):
@@ -3,12 +3,29 @@ import pathlib
 
 DATE_FORMAT = '%Y-%m-%d'
 DEFAULT_CONFIG_FILE = str(pathlib.Path.home().joinpath('configs', 'airsonde.cfg'))
+
+# Re-use OAuth access tokens between runs
+DEFAULT_TOKEN_CACHE = pathlib.Path.home().joinpath('configs', 'airsonde_token.json')
+TOKEN_TTL = 60 * 60  # seconds, if the API doesn't specify the token lifetime
+TOKEN_EXPIRY_MARGIN = 60  # seconds
 FAMILY = 'EMS_AirSonde'
 DESC_URL = 'https://terminal.oizom.com/#/u/devices/info'
 
 # This appears to have a maximum value of about 240 seconds
 DEFAULT_AVERAGING_TIME = 60  # seconds
 
+# Split analytics queries into several requests that each return at most this many data points
+ANALYTICS_MAX_POINTS = 360
+# Number of requests to send at once for each device
+ANALYTICS_WORKERS = 4
+
+# Streaming mode
+STREAM_CHUNK_SIZE = 2 ** 14  # bytes
+STREAM_BUFFER = 1000  # data points buffered per device
+
+# Number of devices to download at once
+DEFAULT_WORKERS = 4
+
 # Map data labels to the Urban Flows metric names
 # See table in docs/Polludrone SMART Parameters Table.pdf
 METRICS = dict(
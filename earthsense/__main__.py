@@ -5,14 +5,21 @@ https://www.earthsense.co.uk/product-resources
 """
 
 import argparse
+import concurrent.futures
 import csv
 import datetime
+import heapq
 import pathlib
 import logging
-from collections import OrderedDict
-from typing import Iterable, Dict
+import operator
+import tempfile
+from typing import Iterable, Sequence, TextIO
 
+import requests.adapters
+
+import aggregate
 import http_session
+import parse
 import settings
 import utils
 
@@ -24,7 +31,6 @@ CSV file.
 LOGGER = logging.getLogger(__name__)
 
 ISO_DATE = '%Y-%m-%d'
-SLOTS = ('A', 'B')
 
 
 class UrbanDialect(csv.excel):
@@ -32,91 +38,75 @@ class UrbanDialect(csv.excel):
     delimiter = '|'
 
 
-def parse_csv(lines: iter) -> iter:
-    reader = csv.reader(lines)
-
-    try:
-        # Line 1 = headers (metric labels)
-        headers = next(reader)
-
-        # Line 2 = units of measurement
-        units = next(reader)
-
-    # No rows
-    except StopIteration:
-        return
-
-    # Meta-data (units)
-    meta = dict(zip(headers, units))
-    meta = remove_empty_strings(meta)
-
-    LOGGER.info(meta)
-
-    yield from csv.DictReader(lines, fieldnames=headers)
-
-
-def remove_empty_strings(row: dict, null=None) -> dict:
-    return {key: value if value.strip() else null for key, value in row.items()}
-
-
-def remove_nulls(row: dict, null=None) -> dict:
-    return {key: null if value == 'None' else value for key, value in row.items()}
+HEADERS = tuple(settings.FIELD_MAP.values())
+get_timestamp = operator.itemgetter(HEADERS.index('timestamp'))
 
 
-def transform(rows: iter, append: dict = None) -> iter:
-    for row in rows:
-        row.update(append)
-        row = remove_nulls(row)
+def get_slot_data(session, device_id, slot: str, start_time, end_time) -> TextIO:
+    """
+    Download the data for one slot on a device and save it in time order to a temporary CSV file, with missing values
+    written as "None" the way the Zephyr API sends them
+    """
+    LOGGER.info("Device %s slot %s", device_id, slot)
 
-        # Concatenate device ID and slot into a "sensor ID"
-        row['device_id'] = str(row['device_id']) + row.pop('slot')
+    lines = session.iter_data(device_id=device_id, slot=slot, start_time=start_time, end_time=end_time)
+    rows = parse.parse_rows(lines, device_id=device_id, slot=slot)
 
-        del row['Timestamp-UTS']
+    file = tempfile.TemporaryFile('w+', newline='')
+    writer = csv.writer(file)
+    for row in sorted(rows, key=get_timestamp):
+        writer.writerow(['None' if value is None else value for value in row])
+    file.seek(0)
 
-        # Rename and reorder columns
-        row = OrderedDict(
-            ((new, row[old])
-             for old, new in settings.FIELD_MAP.items())
-        )
+    return file
 
-        yield row
 
+def read_slot_data(file: TextIO) -> iter:
+    """Read back the rows for one slot, with None for missing values as parse.parse_rows returns them"""
+    with file:
+        for row in csv.reader(file):
+            yield tuple(None if value == 'None' else value for value in row)
 
-def sort(rows: iter) -> iter:
-    yield from sorted(rows, key=lambda row: row['timestamp'])
 
+def get_data(session, start_time, end_time, workers: int = settings.DEFAULT_WORKERS):
+    """
+    Download data for all devices (and all slots on those devices), several at once, merged in time order.
 
-def get_data(session, start_time, end_time):
-    # Iterate over all devices (and all slots on those devices)
-    for internal_device_id, device in session.devices.items():
-        device_id = device['zNumber']
-
+    The merge needs the first row of every slot, so each slot's rows wait in a temporary file rather than in memory
+    until the other slots are downloaded.
+    """
+    devices = session.devices.values()
+    for device in devices:
         LOGGER.info("Device info: %s", device)
 
-        for slot in SLOTS:
-            LOGGER.info("Device %s slot %s", device_id, slot)
+    # Share the connection pool between the threads
+    session.mount(session.BASE_URL, requests.adapters.HTTPAdapter(pool_maxsize=workers))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(get_slot_data, session, device_id=device['zNumber'], slot=slot, start_time=start_time,
+                            end_time=end_time)
+            for device in devices
+            for slot in settings.SLOTS
+        ]
 
-            lines = session.iter_data(device_id=device_id, slot=slot, start_time=start_time, end_time=end_time)
-            rows = parse_csv(lines)
-            rows = transform(rows, append=dict(device_id=device_id, slot=slot))
+        files = [future.result() for future in futures]
 
-            yield from rows
+    yield from heapq.merge(*map(read_slot_data, files), key=get_timestamp)
 
 
-def write_csv(path: pathlib.Path, rows: Iterable[Dict]):
+def write_csv(path: pathlib.Path, headers: Sequence[str], rows: Iterable[Sequence], write_header: bool = False):
     with path.open('w', newline='') as file:
-        writer = None
+        writer = csv.writer(file, dialect=UrbanDialect)
 
         row_count = 0
         for row in rows:
-            row_count += 1
-
-            if not writer:
-                headers = tuple(row.keys())
+            if not row_count:
                 LOGGER.info("CSV headers: %s", headers)
+                if write_header:
+                    writer.writerow(headers)
 
-                writer = csv.DictWriter(file, fieldnames=headers, dialect=UrbanDialect)
-
+            row_count += 1
             writer.writerow(row)
 
     if row_count:
@@ -126,6 +116,11 @@ def write_csv(path: pathlib.Path, rows: Iterable[Dict]):
         LOGGER.info("Deleted '%s'", file.name)
 
 
+def aggregate_path(path: pathlib.Path, label: str) -> pathlib.Path:
+    """Output path for summarised data e.g. data/2020-05-01.hourly.csv"""
+    return path.with_name('{}.{}{}'.format(path.stem, label, path.suffix))
+
+
 def date(date_string: str) -> datetime.date:
     """Parse date"""
     return datetime.datetime.strptime(date_string, ISO_DATE).date()
@@ -140,6 +135,11 @@ def get_args():
     parser.add_argument('-c', '--config', help="Config file", default=settings.DEFAULT_CONFIG_PATH)
     parser.add_argument('-v', '--verbose', help="Increased logging level", action='store_true')
     parser.add_argument('-g', '--debug', help="Debug logging level", action='store_true')
+    parser.add_argument('-w', '--workers', help="Number of device slots to download at once", type=int,
+                        default=settings.DEFAULT_WORKERS)
+    parser.add_argument('-a', '--aggregate', action='store_true',
+                        help="Also write the mean, minimum, maximum and count of each metric over 15-minute and hourly "
+                             "periods to separate files")
 
     args = parser.parse_args()
 
@@ -161,8 +161,19 @@ def main():
     end_time = datetime.datetime.combine(date=args.date + datetime.timedelta(days=1), time=datetime.time.min).replace(
         tzinfo=datetime.timezone.utc)
 
-    rows = sort(get_data(session=session, start_time=start_time, end_time=end_time))
-    write_csv(path=args.output, rows=rows)
+    rows = get_data(session=session, start_time=start_time, end_time=end_time, workers=args.workers)
+
+    if args.aggregate:
+        metrics = [field for field in HEADERS if field not in {'timestamp', 'sensor'}]
+        aggregator = aggregate.Aggregator(headers=HEADERS, metrics=metrics)
+        rows = aggregator.consume(rows)
+
+    write_csv(path=args.output, headers=HEADERS, rows=rows)
+
+    if args.aggregate:
+        for label, period in settings.AGGREGATION_PERIODS.items():
+            write_csv(path=aggregate_path(args.output, label), headers=aggregator.headers,
+                      rows=aggregator.summarise(period), write_header=True)
 
 
 if __name__ == '__main__':
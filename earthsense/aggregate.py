@@ -0,0 +1,129 @@
+"""
+Summarise raw Zephyr data over fixed time periods
+
+The raw data rows are passed through unchanged while their values are collected, so one download produces the raw
+output and any number of averaged outputs (rather than requesting each averaging method from the API separately).
+"""
+
+import logging
+
+import numpy
+
+LOGGER = logging.getLogger(__name__)
+
+# Summary statistics calculated for each metric
+STATISTICS = ('MEAN', 'MIN', 'MAX', 'COUNT')
+
+
+def to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return numpy.nan
+
+
+def to_float_array(values: list) -> numpy.ndarray:
+    """Convert text values to numbers, with missing and non-numeric values as NaN"""
+    try:
+        return numpy.array([value if value else 'nan' for value in values], dtype=float)
+    # Fall back to converting one value at a time
+    except ValueError:
+        LOGGER.warning("Non-numeric values are treated as missing values")
+        return numpy.array([to_float(value) for value in values], dtype=float)
+
+
+def parse_timestamps(timestamps: list) -> numpy.ndarray:
+    """Parse UTC ISO 8601 timestamps e.g. 2020-05-01T00:15:00+00:00 (the time zone is ignored)"""
+    return numpy.array([timestamp[:19] for timestamp in timestamps], dtype='datetime64[s]')
+
+
+class Aggregator:
+    """
+    Calculate the mean, minimum, maximum and number of values of each metric for each sensor over time periods
+    """
+
+    def __init__(self, headers, metrics, timestamp: str = 'timestamp', sensor: str = 'sensor'):
+        """
+        :param headers: Column names of the input rows
+        :param metrics: Names of the numeric columns
+        :param timestamp: Name of the time column
+        :param sensor: Name of the sensor identifier column
+        """
+        headers = list(headers)
+        self.metrics = list(metrics)
+        self.timestamp = timestamp
+        self.sensor = sensor
+
+        self.positions = [headers.index(column) for column in [timestamp, sensor] + self.metrics]
+        self.columns = [list() for _ in self.positions]
+
+    def consume(self, rows) -> iter:
+        """Collect the values from each row (sequence in the order of the headers) while passing the rows through"""
+        columns = tuple(zip(self.positions, (column.append for column in self.columns)))
+        for row in rows:
+            for position, append in columns:
+                append(row[position])
+
+            yield row
+
+    @property
+    def timestamps(self) -> list:
+        return self.columns[0]
+
+    @property
+    def sensors(self) -> list:
+        return self.columns[1]
+
+    @property
+    def headers(self) -> list:
+        return [self.timestamp, self.sensor] + ['{}/{}'.format(metric, statistic) for metric in self.metrics
+                                                for statistic in STATISTICS]
+
+    def summarise(self, period: int) -> iter:
+        """
+        Generate one row (tuple in the order of the headers) for each sensor and time period (in time order)
+
+        :param period: Duration (seconds)
+        """
+        if not self.timestamps:
+            return
+
+        # Assign each row to a group (time period and sensor)
+        times = parse_timestamps(self.timestamps).astype('int64')
+        buckets = times // period
+        sensors, sensor_index = numpy.unique(numpy.array(self.sensors, dtype=str), return_inverse=True)
+        keys = (buckets - buckets.min()) * len(sensors) + sensor_index
+        group_keys, groups = numpy.unique(keys, return_inverse=True)
+        n_groups = len(group_keys)
+
+        group_buckets = group_keys // len(sensors) + buckets.min()
+        group_sensors = sensors[group_keys % len(sensors)]
+        group_times = numpy.datetime_as_string((group_buckets * period).astype('datetime64[s]'), unit='s')
+
+        columns = list()
+        for metric_values in self.columns[2:]:
+            values = to_float_array(metric_values)
+            valid = ~numpy.isnan(values)
+
+            count = numpy.bincount(groups[valid], minlength=n_groups)
+            total = numpy.bincount(groups[valid], weights=values[valid], minlength=n_groups)
+
+            minimum = numpy.full(n_groups, numpy.inf)
+            numpy.minimum.at(minimum, groups[valid], values[valid])
+            maximum = numpy.full(n_groups, -numpy.inf)
+            numpy.maximum.at(maximum, groups[valid], values[valid])
+
+            empty = count == 0
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                mean = total / count
+            for statistic in (mean, minimum, maximum):
+                statistic[empty] = numpy.nan
+
+            columns.extend((mean, minimum, maximum, count))
+
+        LOGGER.info("Summarised %s rows into %s rows of %s seconds", len(times), n_groups, period)
+
+        # Time order (group keys are already in time order)
+        for i in range(n_groups):
+            values = (None if numpy.isnan(column[i]) else column[i].item() for column in columns)
+            yield (group_times[i] + '+00:00', str(group_sensors[i]), *values)
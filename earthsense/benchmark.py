@@ -0,0 +1,126 @@
+"""
+Compare the dictionary-based row transformation with the compiled row converter for one day of data from several
+devices.
+
+Usage:
+python benchmark.py
+python benchmark.py recorded/814A.csv recorded/814B.csv ...
+
+Recorded files are raw CSV responses from the API for one device slot, named with the device ID and slot.
+"""
+
+import csv
+import datetime
+import io
+import pathlib
+import sys
+import timeit
+from collections import OrderedDict
+
+import parse
+import settings
+
+DEVICES = 10
+INTERVAL = datetime.timedelta(seconds=15)
+COLUMNS = ('Timestamp', 'Timestamp-UTS', 'Latitude', 'Longitude', 'Temp', 'Ambient temp', 'Ambient pressure',
+           'Ambient humidity', 'Humidity', 'NO2', 'NO', 'O3', 'PM2.5', 'PM10', 'PM1')
+UNITS = ('', '', 'degrees', 'degrees', 'C', 'C', 'Pa', '%RH', '%RH', 'ug/m3', 'ug/m3', 'ug/m3', 'ug/m3', 'ug/m3',
+         'ug/m3')
+
+REPEAT = 3
+
+
+def simulate_slot(device_id: int) -> str:
+    """One day of data for a device slot in the API CSV format, with some missing values"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    writer.writerow(UNITS)
+
+    start = datetime.datetime(2020, 5, 1, tzinfo=datetime.timezone.utc)
+    for i in range(int(datetime.timedelta(days=1) / INTERVAL)):
+        time = start + i * INTERVAL
+        values = [str(round(device_id + i % 100 * 0.1, 1)) if (i + j) % 13 else 'None' for j in range(len(COLUMNS) - 4)]
+        writer.writerow([time.isoformat(), int(time.timestamp()), '53.38', '-1.47', *values])
+
+    return buffer.getvalue()
+
+
+def load_slots(paths) -> list:
+    """(device ID, slot, CSV text) for each recorded file or simulated device slot"""
+    if paths:
+        return [(path.stem[:-1], path.stem[-1], path.read_text()) for path in map(pathlib.Path, paths)]
+
+    return [(1000 + i, slot, simulate_slot(i)) for i in range(DEVICES) for slot in settings.SLOTS]
+
+
+def parse_csv(lines: iter) -> iter:
+    reader = csv.reader(lines)
+
+    try:
+        headers = parse.read_headers(reader)
+    # No rows
+    except StopIteration:
+        return
+
+    yield from csv.DictReader(lines, fieldnames=headers)
+
+
+def remove_nulls(row: dict, null=None) -> dict:
+    return {key: null if value == 'None' else value for key, value in row.items()}
+
+
+def transform(rows: iter, append: dict = None) -> iter:
+    for row in rows:
+        row.update(append)
+        row = remove_nulls(row)
+
+        # Concatenate device ID and slot into a "sensor ID"
+        row['device_id'] = str(row['device_id']) + row.pop('slot')
+
+        del row['Timestamp-UTS']
+
+        # Rename and reorder columns
+        row = OrderedDict(
+            ((new, row[old])
+             for old, new in settings.FIELD_MAP.items())
+        )
+
+        yield row
+
+
+def dictionaries(slots: list) -> list:
+    """The original transformation, building several dictionaries for each row"""
+    rows = list()
+    for device_id, slot, text in slots:
+        lines = io.StringIO(text)
+        rows.extend(tuple(row.values()) for row in
+                    transform(parse_csv(lines), append=dict(device_id=device_id, slot=slot)))
+    return rows
+
+
+def compiled(slots: list) -> list:
+    rows = list()
+    for device_id, slot, text in slots:
+        rows.extend(parse.parse_rows(io.StringIO(text), device_id=device_id, slot=slot))
+    return rows
+
+
+def main():
+    slots = load_slots(sys.argv[1:])
+
+    expected = dictionaries(slots)
+    actual = compiled(slots)
+    mismatches = sum(a != b for a, b in zip(actual, expected)) + abs(len(actual) - len(expected))
+
+    old = min(timeit.repeat(lambda: dictionaries(slots), number=1, repeat=REPEAT))
+    new = min(timeit.repeat(lambda: compiled(slots), number=1, repeat=REPEAT))
+
+    print("{slots} device slots, {rows} rows: dictionaries {old:.0f} rows/s, compiled {new:.0f} rows/s "
+          "({speedup:.1f}x), {mismatches} mismatches".format(
+              slots=len(slots), rows=len(expected), old=len(expected) / old, new=len(actual) / new,
+              speedup=old / new, mismatches=mismatches))
+
+
+if __name__ == '__main__':
+    main()
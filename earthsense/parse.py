@@ -0,0 +1,78 @@
+"""
+Parse the CSV data for one device slot into output rows
+"""
+
+import csv
+import logging
+import operator
+from typing import Sequence
+
+import settings
+
+LOGGER = logging.getLogger(__name__)
+
+
+def read_headers(reader) -> list:
+    """
+    Read the metric labels (line 1) and units of measurement (line 2)
+
+    :raises StopIteration: No rows
+    """
+    headers = next(reader)
+    units = next(reader)
+
+    # Meta-data (units)
+    meta = dict(zip(headers, units))
+    meta = remove_empty_strings(meta)
+
+    LOGGER.info(meta)
+
+    return headers
+
+
+def remove_empty_strings(row: dict, null=None) -> dict:
+    return {key: value if value.strip() else null for key, value in row.items()}
+
+
+def compile_converter(headers: Sequence[str], device_id, slot: str):
+    """
+    Build a function that converts a CSV row (list of values in the order of the headers) into an output row (tuple
+    in the order of settings.FIELD_MAP). The column positions are looked up once for each file rather than building
+    several dictionaries for every row.
+    """
+    width = len(headers)
+    positions = {header: i for i, header in enumerate(headers)}
+
+    # Concatenate device ID and slot into a "sensor ID"
+    sensor = str(device_id) + slot
+    sensor_position = list(settings.FIELD_MAP).index('device_id')
+
+    indices = [positions[old] for old in settings.FIELD_MAP if old != 'device_id']
+    get_values = operator.itemgetter(*indices)
+
+    def convert(row: list) -> tuple:
+        # Missing values at the end of the line
+        if len(row) < width:
+            row = row + [None] * (width - len(row))
+
+        values = [None if value == 'None' else value for value in get_values(row)]
+        values.insert(sensor_position, sensor)
+
+        return tuple(values)
+
+    return convert
+
+
+def parse_rows(lines: iter, device_id, slot: str) -> iter:
+    """
+    Convert the lines of CSV data from one device slot into output rows (tuples)
+    """
+    reader = csv.reader(lines)
+
+    try:
+        headers = read_headers(reader)
+    # No rows
+    except StopIteration:
+        return
+
+    yield from map(compile_converter(headers, device_id=device_id, slot=slot), reader)
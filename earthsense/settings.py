@@ -4,6 +4,20 @@ from collections import OrderedDict
 CONFIG_DIR = pathlib.Path.home().joinpath('configs')
 DEFAULT_CONFIG_PATH = CONFIG_DIR.joinpath('earthsense.cfg')
 
+# Sensor slots on each Zephyr device
+SLOTS = ('A', 'B')
+
+# Number of device slots to download at once
+DEFAULT_WORKERS = 4
+
+# Time periods to summarise the raw data over (output file label, duration in seconds)
+AGGREGATION_PERIODS = OrderedDict(
+    (
+        ('15min', 15 * 60),
+        ('hourly', 60 * 60),
+    )
+)
+
 # Map EarthSense fields to Urban Flows Observatory structure
 # The order of the items determines that of the columns in the output CSV file.
 FIELD_MAP = OrderedDict(
@@ -2,6 +2,7 @@ import argparse
 import csv
 import http
 import logging
+import tempfile
 import warnings
 import pathlib
 from collections import OrderedDict
@@ -9,8 +10,12 @@ from typing import Iterable, Dict
 
 import requests
 
+import backfill
+import cache
+import columnar
 import http_session
 import objects
+import poll
 import settings
 import utils
 import arrow.factory
@@ -39,11 +44,29 @@ def get_args() -> argparse.Namespace:
     parser.add_argument('-v', '--verbose', action='store_true', help="Enable debug log mode")
     parser.add_argument('-g', '--debug', action='store_true', help='Debug mode')
     parser.add_argument('-e', '--error', help='Error log file (optional)')
-    parser.add_argument('-d', '--date', required=True, type=utils.date, help="ISO UTC date")
-    parser.add_argument('-o', '--output', required=True, type=pathlib.Path, help="Output CSV file path")
+    parser.add_argument('-d', '--date', type=utils.date, help="ISO UTC date")
+    parser.add_argument('-s', '--start', type=utils.date, help="Backfill: first ISO UTC date")
+    parser.add_argument('-n', '--end', type=utils.date, help="Backfill: last ISO UTC date (inclusive)")
+    parser.add_argument('-o', '--output', required=True, type=pathlib.Path,
+                        help="Output CSV file path (output directory in polling and backfill modes)")
+    parser.add_argument('-p', '--poll', action='store_true',
+                        help="Keep running and append new readings to a CSV file for each day")
+    parser.add_argument('-i', '--interval', type=float, default=settings.POLL_INTERVAL,
+                        help="Polling interval (seconds)")
+    parser.add_argument('-w', '--watermarks', type=pathlib.Path,
+                        help="Polling state file path (the latest reading time for each measure, default: {} in the "
+                             "output directory)".format(settings.DEFAULT_WATERMARKS))
+    parser.add_argument('-k', '--workers', type=int, help="Backfill: number of worker processes (default: CPU count)")
+    parser.add_argument('-l', '--downloads', type=int, default=settings.BACKFILL_DOWNLOADS,
+                        help="Backfill: maximum number of simultaneous archive downloads")
 
     args = parser.parse_args()
 
+    if bool(args.start) != bool(args.end):
+        parser.error('--start and --end must be used together')
+    if not (args.date or args.poll or args.start):
+        parser.error('Either --date, --poll or --start and --end is required')
+
     return args
 
 
@@ -90,40 +113,36 @@ def sort(rows: iter, key: str = 'timestamp') -> iter:
     yield from sorted(rows, key=lambda row: row[key])
 
 
-def get_data(session, date, station_ids: set) -> iter:
-    """
-    Download data from the Environment Agency API. First attempts to use the data archive, then use the live data API
-    if that fails, which will happen for more recent dates.
-    """
+def get_cache() -> cache.Cache:
+    """Station metadata cache, shared between runs"""
+    return cache.Cache(settings.CACHE_DIR, ttl=settings.CACHE_TTL)
 
-    # Attempt to fetch archived data
-    try:
-        for row in objects.Reading.get_archive(session, date=date):
-            yield row
 
-    except requests.HTTPError as http_error:
-        # The HTTP error code 404 (not found) means that there is not yet an archived data set for that day
-        if http_error.response.status_code != http.HTTPStatus.NOT_FOUND:
-            raise
+def get_live_data(session, date, station_ids: set) -> iter:
+    """
+    Download data for each station from the live Environment Agency API.
+    """
+    metadata = get_cache()
 
-        # Get data from the live API for more recent data sets
-        for station_id in station_ids:
-            LOGGER.info("Station %s", station_id)
+    for station_id in station_ids:
+        LOGGER.info("Station %s", station_id)
 
-            # Initialise station
-            station = objects.Station(station_id)
-            station.load(session)
+        # Initialise station
+        station = objects.Station(station_id)
+        station.load(session, cache=metadata)
 
-            # Get station data
-            for row in station.readings(session, date=date):
-                parameter = station.measures[row['measure']]['parameter']
-                row['observed_property'] = settings.PARAMETER_MAP[parameter]
-                yield row
+        # Get station data
+        for row in station.readings(session, date=date):
+            parameter = station.measures[row['measure']]['parameter']
+            row['observed_property'] = settings.PARAMETER_MAP[parameter]
+            yield row
 
 
-def serialise(path: pathlib.Path, rows: Iterable[Dict], write_header: bool = False):
+def serialise(path: pathlib.Path, rows: Iterable[Dict], write_header: bool = False, append: bool = False):
     """
     Write the rows of clean data to a file in CSV format.
+
+    :param append: Add rows to the end of an existing file (which won't be deleted if there are no new rows)
     """
     headers = settings.HEADERS
 
@@ -133,7 +152,7 @@ def serialise(path: pathlib.Path, rows: Iterable[Dict], write_header: bool = Fal
     path.parent.mkdir(parents=True, exist_ok=True)
 
     # File output
-    with path.open('w', newline='') as file:
+    with path.open('a' if append else 'w', newline='') as file:
         # CSV formatting
         writer = csv.DictWriter(file, fieldnames=headers, dialect=UrbanDialect)
 
@@ -148,10 +167,31 @@ def serialise(path: pathlib.Path, rows: Iterable[Dict], write_header: bool = Fal
 
     if row_count:
         LOGGER.info("Wrote %s rows to '%s'", row_count, file.name)
-    else:
+    elif not append:
         path.unlink()
         LOGGER.info("Deleted '%s'", file.name)
 
+    return row_count
+
+
+def serialise_table(path: pathlib.Path, table) -> int:
+    """
+    Write a pivoted data frame to a file in CSV format.
+    """
+    if table.empty:
+        LOGGER.info("No data for '%s'", path)
+        return 0
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with path.open('w', newline='') as file:
+        writer = csv.writer(file, dialect=UrbanDialect)
+        writer.writerows(columnar.iter_rows(table))
+
+    LOGGER.info("Wrote %s rows to '%s'", len(table), file.name)
+
+    return len(table)
+
 
 def transform(rows: iter) -> iter:
     """
@@ -165,6 +205,104 @@ def transform(rows: iter) -> iter:
         yield row
 
 
+def process(rows: iter) -> iter:
+    """
+    Select, clean and rearrange raw readings into output rows
+    """
+    # Only include selected stations
+    rows = filter(lambda row: row['station'] in settings.STATIONS, rows)
+
+    return sort(pivot(transform(rows)))
+
+
+def serialise_daily(directory: pathlib.Path, rows: Iterable[Dict]):
+    """
+    Append the rows of clean data to one CSV file per day in the output directory.
+    """
+    days = dict()
+    for row in rows:
+        # ISO 8601 timestamp e.g. 2020-05-01T00:15:00+00:00
+        day = row['timestamp'][:10]
+        days.setdefault(day, list()).append(row)
+
+    for day, day_rows in sorted(days.items()):
+        path = directory.joinpath('{}.csv'.format(day))
+        serialise(path, rows=day_rows, append=True)
+
+
+def run_poll(session, args):
+    """
+    Poll the live API for readings that are newer than the last reading seen for each measure.
+    """
+    watermarks = poll.Watermarks(args.watermarks or args.output.joinpath(settings.DEFAULT_WATERMARKS))
+    watermarks.load()
+
+    stations = poll.load_stations(session, station_ids=settings.STATIONS, cache=get_cache())
+
+    def callback(rows):
+        serialise_daily(args.output, rows=process(rows))
+
+    try:
+        poll.poll(session, stations=stations, watermarks=watermarks, interval=args.interval, callback=callback)
+    except KeyboardInterrupt:
+        LOGGER.info("Polling stopped")
+
+
+def harvest_day(session, day, path: pathlib.Path) -> tuple:
+    """
+    Download data from the Environment Agency API, process it and save it to file. First attempts to use the data
+    archive, then use the live data API if that fails, which will happen for more recent dates.
+
+    :returns: Number of readings processed and number of rows written
+    """
+    with tempfile.TemporaryFile() as file:
+        try:
+            # Limit concurrent downloads across all backfill workers, but don't hold the slot while parsing
+            with backfill.download_slot():
+                objects.Reading.download_archive(session, date=day, file=file)
+
+        except requests.HTTPError as http_error:
+            # The HTTP error code 404 (not found) means that there is not yet an archived data set for that day
+            if http_error.response.status_code != http.HTTPStatus.NOT_FOUND:
+                raise
+
+            # Get data from the live API for more recent data sets
+            readings = backfill.Counter(get_live_data(session, date=day, station_ids=settings.STATIONS))
+            rows = serialise(path, rows=process(readings))
+            return readings.count, rows
+
+        # Decode the whole archive as arrays
+        file.seek(0)
+        frame = columnar.read_archive(file, stations=settings.STATIONS)
+        rows = serialise_table(path, columnar.pivot(frame))
+
+    return len(frame), rows
+
+
+def backfill_day(day, directory: pathlib.Path) -> tuple:
+    """
+    Harvest one day of data to a file in the output directory (in a worker process).
+    """
+    session = http_session.FloodSession()
+    return harvest_day(session, day=day, path=directory.joinpath('{}.csv'.format(day)))
+
+
+def run_backfill(args) -> list:
+    """
+    Process the archive for each day in the date range in parallel.
+
+    :returns: Days that failed
+    """
+    days = backfill.date_range(args.start, args.end)
+
+    stats = backfill.run(days, worker=backfill_day, workers=args.workers, downloads=args.downloads,
+                         directory=args.output)
+
+    print(backfill.summarise(stats))
+
+    return stats['failed']
+
+
 def main():
     args = get_args()
     utils.configure_logging(verbose=args.verbose, debug=args.debug, error=args.error)
@@ -172,17 +310,16 @@ def main():
     # Connect to the Environment Agency API
     session = http_session.FloodSession()
 
-    # Retrieve raw data
-    rows = get_data(session, date=args.date, station_ids=settings.STATIONS)
-
-    # Only include selected stations
-    rows = filter(lambda row: row['station'] in settings.STATIONS, rows)
-
-    # Process data
-    rows = sort(pivot(transform(rows)))
+    if args.poll:
+        run_poll(session, args)
+        return
+    elif args.start:
+        if run_backfill(args):
+            raise SystemExit(1)
+        return
 
-    # Output to file
-    serialise(args.output, rows=rows)
+    # Retrieve data, process and output to file
+    harvest_day(session, day=args.date, path=args.output)
 
 
 if __name__ == '__main__':
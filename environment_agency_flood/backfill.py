@@ -0,0 +1,113 @@
+"""
+Process the historic readings archive for a range of dates in parallel.
+
+Each day's archive is a national CSV dump file of tens of megabytes so parsing is CPU-bound. The days are processed
+in a pool of worker processes, but the number of simultaneous downloads is limited separately so the API isn't
+flooded with requests.
+"""
+
+import contextlib
+import datetime
+import logging
+import multiprocessing
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# Shared between worker processes to limit the number of concurrent downloads
+_download_semaphore = None
+
+
+def _init_worker(semaphore):
+    global _download_semaphore
+    _download_semaphore = semaphore
+
+
+@contextlib.contextmanager
+def download_slot():
+    """Wait until fewer than the maximum number of downloads are in progress"""
+    if _download_semaphore is None:
+        yield
+    else:
+        with _download_semaphore:
+            yield
+
+
+def date_range(start: datetime.date, end: datetime.date) -> iter:
+    """Generate each day from the start date to the end date (inclusive)"""
+    day = start
+    while day <= end:
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+class Counter:
+    """Count the items as they pass through an iterable"""
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.count = 0
+
+    def __iter__(self):
+        for item in self.iterable:
+            self.count += 1
+            yield item
+
+
+def _run_task(task: tuple) -> tuple:
+    """Call the worker function for one day, catching errors so that the other days continue"""
+    worker, day, kwargs = task
+    try:
+        return day, worker(day, **kwargs), None
+    except Exception as error:
+        LOGGER.exception(error)
+        return day, None, repr(error)
+
+
+def run(days, worker, workers: int = None, downloads: int = 1, **kwargs) -> dict:
+    """
+    Run the worker function for each day in a pool of processes.
+
+    :param days: Dates to process
+    :param worker: Function that takes a date (and keyword arguments) and returns the number of readings and rows
+    :param workers: Number of worker processes (default: number of CPUs)
+    :param downloads: Maximum number of simultaneous downloads
+    :returns: Throughput statistics
+    """
+    days = list(days)
+    semaphore = multiprocessing.Semaphore(downloads)
+    tasks = ((worker, day, kwargs) for day in days)
+
+    stats = dict(days=0, readings=0, rows=0, failed=list())
+    start = time.monotonic()
+
+    with multiprocessing.Pool(processes=workers, initializer=_init_worker, initargs=(semaphore,)) as pool:
+        for day, result, error in pool.imap_unordered(_run_task, tasks):
+            if error:
+                LOGGER.error("Failed %s: %s", day, error)
+                stats['failed'].append(day)
+                continue
+
+            readings, rows = result
+            LOGGER.info("Finished %s: %s readings, %s rows", day, readings, rows)
+            stats['days'] += 1
+            stats['readings'] += readings
+            stats['rows'] += rows
+
+    stats['seconds'] = time.monotonic() - start
+
+    return stats
+
+
+def summarise(stats: dict) -> str:
+    """Describe the throughput of a backfill run"""
+    seconds = max(stats['seconds'], 1e-9)
+    return "Processed {days} days ({failed} failed) in {seconds:.1f}s: {days_per_min:.2f} days/min, " \
+           "{readings_per_sec:.0f} readings/s, {rows_per_sec:.0f} rows/s written".format(
+        days=stats['days'],
+        failed=len(stats['failed']),
+        seconds=stats['seconds'],
+        days_per_min=stats['days'] / seconds * 60,
+        readings_per_sec=stats['readings'] / seconds,
+        rows_per_sec=stats['rows'] / seconds,
+    )
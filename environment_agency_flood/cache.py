@@ -0,0 +1,88 @@
+"""
+On-disk cache for API metadata
+
+Station and measure metadata rarely change so it's stored locally as JSON files and only requested again from the API
+once it has expired.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Cache:
+    """
+    Store JSON-serialisable objects in a directory (one file per key) for a limited time. Safe to use from several
+    threads or processes because files are replaced atomically.
+    """
+
+    def __init__(self, directory: pathlib.Path, ttl: float):
+        """
+        :param directory: Cache file location
+        :param ttl: Time-to-live: how long items are valid for (seconds)
+        """
+        self.directory = pathlib.Path(directory)
+        self.ttl = ttl
+        self._memory = dict()
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> pathlib.Path:
+        filename = '{}.json'.format(hashlib.sha1(key.encode()).hexdigest())
+        return self.directory.joinpath(filename)
+
+    def get(self, key: str):
+        """
+        Retrieve an item that hasn't expired
+
+        :raises KeyError: Item isn't cached or has expired
+        """
+        try:
+            return self._memory[key]
+        except KeyError:
+            pass
+
+        path = self.path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                raise KeyError(key)
+
+            with path.open() as file:
+                value = json.load(file)
+        except (FileNotFoundError, ValueError):
+            raise KeyError(key)
+
+        self._memory[key] = value
+        return value
+
+    def set(self, key: str, value):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+
+        # Unique temporary file per thread
+        temp_path = path.with_name('{}.{}.{}.tmp'.format(path.name, os.getpid(), threading.get_ident()))
+        with temp_path.open('w') as file:
+            json.dump(value, file)
+        os.replace(str(temp_path), str(path))
+
+        with self._lock:
+            self._memory[key] = value
+
+        LOGGER.debug("Cached '%s'", key)
+
+    def fetch(self, key: str, func):
+        """
+        Get the item from the cache, or call the function to retrieve it if it isn't cached
+        """
+        try:
+            return self.get(key)
+        except KeyError:
+            LOGGER.debug("Cache miss '%s'", key)
+            value = func()
+            self.set(key, value)
+            return value
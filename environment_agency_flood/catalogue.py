@@ -0,0 +1,126 @@
+"""
+Local catalogue of Environment Agency monitoring stations
+
+The complete list of stations is downloaded once and cached on disk. Stations are indexed on a grid of latitude and
+longitude cells so that radius queries only need to check the stations in nearby cells, and by catchment name.
+"""
+
+import logging
+import math
+
+import objects
+import settings
+
+LOGGER = logging.getLogger(__name__)
+
+# Mean radius of the Earth
+EARTH_RADIUS = 6371.0  # km
+
+
+def distance(lat1: float, long1: float, lat2: float, long2: float) -> float:
+    """Great-circle (haversine) distance between two points in km"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(long2 - long1)
+
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def get_coordinate(station: dict, key: str):
+    """Some stations have several coordinates (a list) or none at all"""
+    value = station.get(key)
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return value
+
+
+class StationCatalogue:
+    """
+    Stations indexed by location and catchment
+    """
+
+    def __init__(self, stations: list, cell_size: float = settings.GRID_CELL_SIZE):
+        """
+        :param stations: Station records from the API
+        :param cell_size: Grid cell width (degrees)
+        """
+        self.stations = stations
+        self.cell_size = cell_size
+
+        self.grid = dict()
+        self.catchments = dict()
+
+        for station in self.stations:
+            # If a single measure is returned, convert it into a list to maintain consistent API
+            measures = station.setdefault('measures', list())
+            if isinstance(measures, dict):
+                station['measures'] = [measures]
+
+            lat = get_coordinate(station, 'lat')
+            long = get_coordinate(station, 'long')
+            if lat is None or long is None:
+                LOGGER.debug("No location for station %s", station['@id'])
+            else:
+                self.grid.setdefault(self.cell(lat, long), list()).append((lat, long, station))
+
+            catchment = station.get('catchmentName')
+            if catchment:
+                self.catchments.setdefault(catchment, list()).append(station)
+
+        LOGGER.info("Indexed %s stations in %s grid cells and %s catchments", len(self.stations), len(self.grid),
+                    len(self.catchments))
+
+    def __len__(self):
+        return len(self.stations)
+
+    @classmethod
+    def load(cls, session, cache, refresh: bool = False):
+        """
+        Get all the stations from the cache, or from the API if the cache has expired
+
+        :param cache: cache.Cache
+        :param refresh: Ignore the cache and retrieve the stations from the API
+        """
+        key = objects.Station.edge
+
+        if refresh:
+            cache.set(key, objects.Station.list(session))
+
+        return cls(cache.fetch(key, lambda: objects.Station.list(session)))
+
+    def cell(self, lat: float, long: float) -> tuple:
+        return math.floor(lat / self.cell_size), math.floor(long / self.cell_size)
+
+    def radius(self, lat: float, long: float, dist: float) -> list:
+        """
+        Stations within the specified distance (km) of a point, equivalent to the lat, long and dist API parameters
+        """
+        # Bounding box (in degrees) around the circle. Lines of longitude get closer together away from the equator.
+        d_lat = math.degrees(dist / EARTH_RADIUS)
+        d_long = d_lat / max(math.cos(math.radians(lat)), 1e-6)
+
+        lat_min, long_min = self.cell(lat - d_lat, long - d_long)
+        lat_max, long_max = self.cell(lat + d_lat, long + d_long)
+
+        stations = list()
+        for i in range(lat_min, lat_max + 1):
+            for j in range(long_min, long_max + 1):
+                for station_lat, station_long, station in self.grid.get((i, j), list()):
+                    if distance(lat, long, station_lat, station_long) <= dist:
+                        stations.append(station)
+
+        return stations
+
+    def catchment(self, name: str) -> list:
+        """Stations in a drainage basin (equivalent to the catchmentName API parameter)"""
+        return self.catchments.get(name, list())
+
+    def in_catchments(self, names) -> list:
+        """Stations in any of several drainage basins, listing each station once even if the names are repeated"""
+        stations = dict()
+        for name in names:
+            for station in self.catchment(name):
+                stations.setdefault(station['stationReference'], station)
+        return list(stations.values())
@@ -0,0 +1,106 @@
+"""
+Columnar decoding of the historic readings archive
+
+The daily dump files contain readings for every station in the country. Rather than parsing each row in Python, the
+whole file is loaded into arrays and the timestamps, values and multi-value cells are converted in vectorised
+operations before pivoting the readings into one row per station and timestamp.
+
+https://environment.data.gov.uk/flood-monitoring/doc/reference#historic-readings
+"""
+
+import logging
+
+import numpy
+import pandas
+
+import settings
+import utils
+
+LOGGER = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = ['dateTime', 'station', 'measure', 'parameter', 'value']
+
+
+def parse_timestamps(timestamps: pandas.Series) -> pandas.Series:
+    """Convert to UTC ISO 8601 strings e.g. 2020-05-01T00:15:00+00:00 (equivalent to utils.parse_timestamp)"""
+    return pandas.to_datetime(timestamps, utc=True).dt.strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+
+def parse_multiple_values(value: str, sep: str = '|') -> float:
+    try:
+        return utils.parse_multiple_values(value, sep=sep)
+    except ValueError:
+        return numpy.nan
+
+
+def parse_values(values: pandas.Series, sep: str = '|') -> pandas.Series:
+    """
+    Convert to numbers. Some values look like '0.121|0.130|0.017' for some reason so take the mean average of those
+    (equivalent to utils.parse_value, except that values that aren't numbers are missing)
+    """
+    numbers = pandas.to_numeric(values, errors='coerce')
+
+    # Multi-value cells are rare, so average them one at a time with statistics.mean to get exactly the same result
+    multiple = numbers.isna() & values.str.contains(sep, regex=False, na=False)
+    if multiple.any():
+        numbers[multiple] = values[multiple].map(lambda value: parse_multiple_values(value, sep=sep))
+
+    return numbers
+
+
+def read_archive(file, stations=None) -> pandas.DataFrame:
+    """
+    Load a historic readings dump file into a data frame
+
+    :param file: CSV file path or object
+    :param stations: Only include readings for these station URIs
+    :returns: Columns timestamp, station, measure, observed_property, value
+    """
+    frame = pandas.read_csv(file, usecols=ARCHIVE_COLUMNS, dtype=str, keep_default_na=False)
+    LOGGER.info("Loaded %s readings", len(frame))
+
+    # Select stations before decoding anything else to minimise work
+    if stations is not None:
+        frame = frame[frame['station'].isin(stations)]
+
+    observed_property = frame['parameter'].map(settings.PARAMETER_MAP)
+    unknown = observed_property.isna()
+    if unknown.any():
+        LOGGER.warning("Skipped %s readings with unknown parameters: %s", unknown.sum(),
+                       sorted(frame.loc[unknown, 'parameter'].unique()))
+
+    frame = pandas.DataFrame(dict(
+        timestamp=parse_timestamps(frame['dateTime']),
+        station=frame['station'],
+        measure=frame['measure'],
+        observed_property=observed_property,
+        value=parse_values(frame['value']),
+    ))[~unknown]
+
+    return frame
+
+
+def pivot(frame: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Make one row for each station and timestamp with a column for each observed property, in ascending time order
+    (equivalent to the row-based transform, pivot and sort)
+    """
+    if frame.empty:
+        return pandas.DataFrame(columns=settings.HEADERS)
+
+    frame = frame.assign(station=frame['station'].str.rpartition('/')[2])
+
+    # If there are several readings for the same property, use the last one
+    table = frame.pivot_table(index=['timestamp', 'station'], columns='observed_property', values='value',
+                              aggfunc='last')
+
+    table = table.reindex(columns=list(settings.PARAMETER_MAP.values()))
+    table = table.reset_index()
+
+    return table[settings.HEADERS]
+
+
+def iter_rows(table: pandas.DataFrame) -> iter:
+    """Generate tuples in the order of the output columns, with missing values as None"""
+    table = table.astype(object).where(table.notna(), None)
+    return table.itertuples(index=False, name=None)
@@ -1,27 +1,39 @@
-from http_session import FloodSession
+import collections
 import csv
-from utils import make_dir
 import logging
+import concurrent.futures
+import os
+import requests.adapters
 import http_session
+import cache
+import settings
 
 LOGGER = logging.getLogger(__name__)
 
 class FloodHarvestor(object):
     """A harvestor for Environment Agency Flood observations"""
 
-    def __init__(self, date, distance, update_meta, output_meta, logger):
+    def __init__(self, date, distance, update_meta, output_meta, logger, cache_dir=settings.CACHE_DIR,
+                 cache_ttl=settings.CACHE_TTL, workers=settings.HARVEST_WORKERS):
         """Initiate the properties"""
 
         self.date = date
         self.distance = distance
         self.update_meta = update_meta
         self.output_meta = output_meta
-        make_dir(self.output_meta)
+        os.makedirs(self.output_meta, exist_ok=True)
 
         self.logger = logger
 
         self.session = http_session.FloodSession()
-        self.base_url = 'https://environment.data.gov.uk/flood-monitoring/'
+
+        # Concurrent station reading streams share one connection pool
+        self.workers = workers
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.workers)
+        self.session.mount('https://', adapter)
+
+        # Station and measure metadata, shared between runs
+        self.cache = cache.Cache(cache_dir, ttl=cache_ttl)
 
         # Station filters
         self.coordinates = (53.379699, -1.469815)  # lat, long
@@ -65,7 +77,7 @@ class FloodHarvestor(object):
         station_ids = set()
 
         for query in self.filters[1:2]:
-            data = self.session.call(self.base_url, 'id/stations', params=query)
+            data = self.session.call('stations', params=query)
 
             for station in data['items'][1:2]:
                 station_id = station['@id']
@@ -74,52 +86,67 @@ class FloodHarvestor(object):
                 if station_id not in station_ids:
                     station_ids.add(station_id)
 
-                    yield self.session.call(self.base_url, 'id/stations/{}'.format(
-                        station['notation'])) if self.update_meta else station
+                    yield self.get_station(station['notation']) if self.update_meta else station
+
+    def get_station(self, notation: str) -> dict:
+        """Get the full station record (from the cache if possible)"""
+        endpoint = 'stations/{}'.format(notation)
+        return self.cache.fetch(self.session.build_url(endpoint), lambda: self.session.call(endpoint)['items'])
+
+    def get_measure(self, url: str) -> dict:
+        """Get measure info (from the cache if possible)"""
+        return self.cache.fetch(url, lambda: self.session.get(url).json()['items'])
 
     def get_data(self, stations) -> iter:
-        """Generate rows of data for the specified stations"""
+        """
+        Generate rows of data for the specified stations in order, downloading several stations at once. Only the
+        stations that are being downloaded are held in memory.
+        """
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = collections.deque()
+
+            for station in stations:
+                futures.append(executor.submit(list, self.get_station_data(station)))
+
+                if len(futures) >= self.workers:
+                    yield from futures.popleft().result()
 
-        measures = dict()
+            while futures:
+                yield from futures.popleft().result()
 
-        for station in stations:
+    def get_station_data(self, station) -> iter:
+        """Generate the rows of data for one station"""
 
-            for key, value in station.items():
-                self.logger.info("STATION %s: %s", key, value)
+        for key, value in station.items():
+            self.logger.info("STATION %s: %s", key, value)
 
-            endpoint = 'id/stations/{station_id}/readings.csv'.format(
-                station_id=station["items"]["stationReference"])
+        endpoint = 'stations/{station_id}/readings.csv'.format(station_id=station["stationReference"])
 
-            params = dict(
-                date=self.date.strftime("%Y-%m-%d"),
-                _limit=10000
-            )
-            data = self.session.call_iter(self.base_url, endpoint, params=params)
+        params = dict(
+            date=self.date.strftime("%Y-%m-%d"),
+            _limit=10000
+        )
+        data = self.session.call_iter(endpoint, params=params)
 
-            reader = csv.DictReader(data)
+        reader = csv.DictReader(data)
 
-            # Iterate over data points
-            for row in reader:
+        # Iterate over data points
+        for row in reader:
 
-                # Insert station info
-                row['lat'] = station["items"]["lat"]
-                row['long'] = station["items"]["long"]
-                row['station'] = station["items"]["@id"]
+            # Insert station info
+            row['lat'] = station["lat"]
+            row['long'] = station["long"]
+            row['station'] = station["@id"]
 
-                # Get measure info
-                try:
-                    measure = measures[row['measure']]
-                except KeyError:
-                    # Get measure if not already retrieved
-                    measure = self.session.get(row['measure']).json()['items']
-                    # Save for re-use
-                    measures[measure['@id']] = measure
+            # Get measure info
+            measure = self.get_measure(row['measure'])
 
-                # Insert measure info
-                row['parameter_name'] = measure['parameterName']
-                row['unit'] = measure['unitName']
+            # Insert measure info
+            row['parameter_name'] = measure['parameterName']
+            row['unit'] = measure['unitName']
 
-                yield row
+            yield row
 
     def transform(self, row: dict) -> dict:
         """Clean a row of data"""
@@ -60,3 +60,10 @@ class FloodSession(requests.Session):
             response.encoding = 'utf-8'
 
         yield from response.iter_lines(decode_unicode=True)
+
+    def call_chunks(self, endpoint: str, chunk_size: int = 2 ** 16, **kwargs) -> iter:
+        """Generate chunks of raw bytes"""
+
+        response = self._call(endpoint=endpoint, stream=True, **kwargs)
+
+        yield from response.iter_content(chunk_size=chunk_size)
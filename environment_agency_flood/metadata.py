@@ -3,8 +3,9 @@ import logging
 import json
 
 import assets
+import cache
+import catalogue
 import http_session
-import objects
 import settings
 
 DESCRIPTION = """
@@ -18,6 +19,7 @@ into Urban Flows Observatory assets (Sites and Sensors).
 USAGE = """
 python metadata.py --sites
 python metadata.py --sensors
+python metadata.py --sites --sensors --catchment "Don and Rother"
 """
 
 LOGGER = logging.getLogger(__name__)
@@ -35,6 +37,9 @@ def get_args():
     parser.add_argument('-s', '--sites', action='store_true', help='Generate Urban Flows metadata files')
     parser.add_argument('-n', '--sensors', action='store_true', help='Generate Urban Flows metadata files')
     parser.add_argument('-c', '--csv', action='store_true', help='Show CSV headers')
+    parser.add_argument('-a', '--catchment', action='append',
+                        help='Select stations in this catchment instead of by distance (may be used several times)')
+    parser.add_argument('-r', '--refresh', action='store_true', help='Update the cached station catalogue')
 
     return parser, parser.parse_args()
 
@@ -78,26 +83,35 @@ def main():
     if args.csv:
         print(settings.UrbanDialect.delimiter.join(settings.HEADERS))
     elif args.station_ids or args.measures or args.sites or args.sensors:
-        measures = set()
-
-        # Iterate over stations
-        for station in objects.Station.list(session, lat=args.lat, long=args.long, dist=args.dist):
+        # Query the local station catalogue
+        stations = catalogue.StationCatalogue.load(session, cache=cache.Cache(settings.CACHE_DIR, settings.CACHE_TTL),
+                                                   refresh=args.refresh)
+        if args.catchment:
+            selected = stations.in_catchments(args.catchment)
+        else:
+            selected = stations.radius(lat=args.lat, long=args.long, dist=args.dist)
+
+        measures = list()
+
+        # Iterate over stations once for all the selected outputs
+        for station in selected:
             # List station Ids
             if args.station_ids:
                 print(station['@id'])
 
-            # List measure IDs
-            elif args.measures:
-                # Print unique measures
-                measures.update((measure['@id'] for measure in station['measures']))
-                for measure in measures:
-                    print(measure)
+            # Collect measure IDs
+            if args.measures:
+                measures.extend(measure['@id'] for measure in station['measures'])
 
             # Get UFO assets
-            elif args.sites:
+            if args.sites:
                 print(station_to_site(station))
-            elif args.sensors:
+            if args.sensors:
                 print(station_to_sensor(station))
+
+        # Print unique measures
+        for measure in sorted(set(measures)):
+            print(measure)
     else:
         parser.print_help()
 
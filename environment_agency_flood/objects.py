@@ -4,7 +4,6 @@ import csv
 from collections import OrderedDict, Mapping
 
 import utils
-import settings
 
 LOGGER = logging.getLogger(__name__)
 
@@ -35,8 +34,16 @@ class Object:
     def get(self, session) -> dict:
         return session.call(self.endpoint)['items']
 
-    def load(self, session):
-        data = self.get(session)
+    def load(self, session, cache=None):
+        """
+        Retrieve the object's properties
+
+        :param cache: Metadata cache (cache.Cache) to use instead of calling the API when the object was loaded recently
+        """
+        if cache is None:
+            data = self.get(session)
+        else:
+            data = cache.fetch(session.build_url(self.endpoint), lambda: self.get(session))
 
         for attr, value in data.items():
             setattr(self, attr, value)
@@ -111,36 +118,14 @@ class Reading(Object):
     """
     edge = 'data/readings'
 
-    @classmethod
-    def _get_archive(cls, session, date):
-        endpoint = "../archive/readings-full-{date}.csv".format(date=date)
-
-        lines = session.call_iter(endpoint)
-        headers = next(csv.reader(lines))
-
-        return csv.DictReader(lines, fieldnames=headers)
+    @staticmethod
+    def _archive_endpoint(date) -> str:
+        return "../archive/readings-full-{date}.csv".format(date=date)
 
     @classmethod
-    def get_archive(cls, session, date):
+    def download_archive(cls, session, date, file):
         """
-        Historic Readings. The measurement readings are archived daily as dump files in CSV format.
-
-        https://environment.data.gov.uk/flood-monitoring/doc/reference#historic-readings
+        Save the historic readings dump file for one day to a (binary) file object
         """
-        for row in cls._get_archive(session=session, date=date):
-            # Rename columns
-            yield OrderedDict(
-                timestamp=utils.parse_timestamp(row['dateTime']),
-                station=row['station'],
-                station_reference=row['stationReference'],
-                measure=row['measure'],
-                unit_name=row['unitName'],
-                value=utils.parse_value(row['value']),
-                datumType=row['datumType'],
-                label=row['label'],
-                parameter=row['parameter'],
-                qualifier=row['qualifier'],
-                period=row['period'],
-                value_type=row['valueType'],
-                observed_property=settings.PARAMETER_MAP[row['parameter']],
-            )
+        for chunk in session.call_chunks(cls._archive_endpoint(date)):
+            file.write(chunk)
@@ -0,0 +1,169 @@
+"""
+Near-real-time polling of the Environment Agency flood monitoring API
+
+The live API publishes new readings roughly every 15 minutes. Rather than downloading a whole day of data on each run,
+keep the timestamp of the newest reading seen for each measure (a "watermark") and only request readings that are
+newer than that using the API's `since` parameter.
+
+https://environment.data.gov.uk/flood-monitoring/doc/reference#readings
+"""
+
+import datetime
+import json
+import logging
+import os
+import pathlib
+import time
+
+import requests
+
+import objects
+import settings
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Watermarks(dict):
+    """
+    The latest reading timestamp (ISO 8601 string) that has been retrieved for each measure, persisted to disk so
+    that polling may resume after a restart.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        super().__init__()
+        self.path = pathlib.Path(path)
+
+    def load(self):
+        try:
+            with self.path.open() as file:
+                self.update(json.load(file))
+                LOGGER.info("Loaded %s watermarks from '%s'", len(self), file.name)
+        except FileNotFoundError:
+            LOGGER.info("No watermarks found at '%s'", self.path)
+
+    def save(self):
+        """Persist the watermarks. If polling is killed mid-write, the previous watermarks are kept."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with temp_path.open('w') as file:
+            json.dump(self, file, indent=2, sort_keys=True)
+        os.replace(str(temp_path), str(self.path))
+        LOGGER.debug("Saved %s watermarks to '%s'", len(self), self.path)
+
+    def since(self, measures) -> str:
+        """
+        The earliest watermark for these measures, which is the time to request new readings from. Measures that have
+        never been seen start from midnight (UTC) today.
+        """
+        midnight = datetime.datetime.combine(datetime.datetime.utcnow().date(), datetime.time.min,
+                                             tzinfo=datetime.timezone.utc).isoformat()
+        return min(self.get(measure, midnight) for measure in measures)
+
+    def is_new(self, row: dict) -> bool:
+        """Has this reading not been retrieved already?"""
+        try:
+            return row['timestamp'] > self[row['measure']]
+        except KeyError:
+            return True
+
+    def advance(self, row: dict):
+        """Move the watermark for this reading's measure forwards"""
+        if self.is_new(row):
+            self[row['measure']] = row['timestamp']
+
+
+def load_stations(session, station_ids, cache=None) -> list:
+    """
+    Retrieve station metadata (including measures) once so it isn't requested on every poll
+
+    :param cache: Station metadata cache (cache.Cache)
+    """
+    stations = list()
+    for station_id in station_ids:
+        station = objects.Station(station_id)
+        station.load(session, cache=cache)
+        stations.append(station)
+    return stations
+
+
+def get_readings(session, station, since: str) -> iter:
+    """
+    Generate all the readings for a station since a time, one page at a time so that none are cut off by the limit on
+    the number of readings returned per request
+    """
+    offset = 0
+    while True:
+        count = 0
+        for row in station.readings(session, since=since, _limit=settings.POLL_LIMIT, _offset=offset):
+            count += 1
+            yield row
+
+        if count < settings.POLL_LIMIT:
+            break
+
+        offset += count
+
+
+def get_new_readings(session, stations, watermarks: Watermarks) -> iter:
+    """
+    Generate readings that are newer than the watermark for their measure. The watermarks aren't changed, so every
+    reading is compared with the watermarks as they were at the start of the poll.
+    """
+    for station in stations:
+        since = watermarks.since(station.measures.keys())
+        LOGGER.info("Station %s since %s", station.object_id, since)
+
+        # Hold the station's readings until every page has been received, because the newest readings come first
+        # and the watermarks would otherwise skip the pages that weren't read
+        try:
+            rows = list(get_readings(session, station=station, since=since))
+
+        # Skip this station until the next poll if the API is unavailable
+        except requests.RequestException as error:
+            LOGGER.error("Station %s: %s", station.object_id, error)
+            continue
+
+        for row in rows:
+            # The API includes readings at the "since" time so skip any we already have
+            if not watermarks.is_new(row):
+                continue
+
+            parameter = station.measures[row['measure']]['parameter']
+            row['observed_property'] = settings.PARAMETER_MAP[parameter]
+
+            yield row
+
+
+def poll_once(session, stations, watermarks: Watermarks, callback) -> int:
+    """
+    Retrieve and process the readings that are newer than the watermarks, then advance and save the watermarks
+
+    :returns: Number of new readings
+    """
+    rows = list(get_new_readings(session, stations=stations, watermarks=watermarks))
+    LOGGER.info("Retrieved %s new readings", len(rows))
+
+    if rows:
+        callback(rows)
+
+    # Only advance and persist the watermarks once the readings are safely on disk
+    for row in rows:
+        watermarks.advance(row)
+    watermarks.save()
+
+    return len(rows)
+
+
+def poll(session, stations, watermarks: Watermarks, interval: float, callback):
+    """
+    Retrieve new readings at regular intervals, forever.
+
+    :param callback: Function to process each batch of new readings
+    :param interval: Number of seconds between the start of each poll
+    """
+    while True:
+        start = time.monotonic()
+
+        poll_once(session, stations=stations, watermarks=watermarks, callback=callback)
+
+        time.sleep(max(interval - (time.monotonic() - start), 0))
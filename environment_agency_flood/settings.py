@@ -1,4 +1,5 @@
 import csv
+import pathlib
 from collections import OrderedDict
 
 # Map environment agency API labels to Urban Obs.
@@ -18,6 +19,24 @@ DEFAULT_LATITUDE = 53.37
 DEFAULT_LONGITUDE = -1.47
 DEFAULT_DISTANCE = 30
 
+# Polling mode: the live API is updated every 15 minutes
+POLL_INTERVAL = 15 * 60  # seconds
+POLL_LIMIT = 10000  # maximum readings per station per poll
+DEFAULT_WATERMARKS = 'watermarks.json'  # in the output directory
+
+# Backfill mode: limit simultaneous archive downloads (each is a national dump file of tens of MB)
+BACKFILL_DOWNLOADS = 2
+
+# Station and measure metadata cache
+CACHE_DIR = pathlib.Path.home().joinpath('.cache', 'environment_agency_flood')
+CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+
+# Station catalogue spatial index grid cell size
+GRID_CELL_SIZE = 0.25  # degrees
+
+# Number of station reading streams to download at once
+HARVEST_WORKERS = 4
+
 HEADERS = ['timestamp', 'station'] + list(PARAMETER_MAP.values())
 
 
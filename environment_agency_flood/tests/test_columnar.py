@@ -0,0 +1,35 @@
+import io
+import unittest
+
+import pandas
+
+import columnar
+import utils
+
+ARCHIVE = """dateTime,station,stationReference,measure,unitName,value,datumType,label,parameter,qualifier,period,valueType
+2020-05-01T00:15:00Z,http://environment.data.gov.uk/flood-monitoring/id/stations/L0405,L0405,http://environment.data.gov.uk/flood-monitoring/id/measures/L0405-level-stage-i-15_min-m,m,0.121,,Sheffield,level,Stage,900,instantaneous
+2020-05-01T00:15:00Z,http://environment.data.gov.uk/flood-monitoring/id/stations/L0405,L0405,http://environment.data.gov.uk/flood-monitoring/id/measures/L0405-rainfall-tipping_bucket_raingauge-t-15_min-mm,mm,0.1|0.2|0.3,,Sheffield,rainfall,Tipping Bucket Raingauge,900,total
+2020-05-01T00:30:00Z,http://environment.data.gov.uk/flood-monitoring/id/stations/L0405,L0405,http://environment.data.gov.uk/flood-monitoring/id/measures/L0405-level-stage-i-15_min-m,m,0.121|0.130|0.017|-0.033|0.053|0.116|3.390|0.015,,Sheffield,level,Stage,900,instantaneous
+"""
+
+
+class TestColumnar(unittest.TestCase):
+
+    def test_same_as_row_by_row_parsing(self):
+        frame = columnar.read_archive(io.StringIO(ARCHIVE))
+        lines = ARCHIVE.splitlines()[1:]
+
+        self.assertEqual(len(frame), len(lines))
+
+        for (timestamp, value), line in zip(frame[['timestamp', 'value']].itertuples(index=False), lines):
+            fields = line.split(',')
+            self.assertEqual(timestamp, utils.parse_timestamp(fields[0]))
+            self.assertEqual(value, utils.parse_value(fields[5]))
+
+    def test_invalid_multiple_values_are_missing(self):
+        values = columnar.parse_values(pandas.Series(['1|x', '']))
+        self.assertTrue(values.isna().all())
+
+
+if __name__ == '__main__':
+    unittest.main()
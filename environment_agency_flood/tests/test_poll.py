@@ -0,0 +1,121 @@
+import pathlib
+import tempfile
+import unittest
+
+import requests
+
+import poll
+import settings
+
+MEASURE = 'http://environment.data.gov.uk/flood-monitoring/id/measures/L0405-level-stage-i-15_min-m'
+
+
+class FakeStation:
+    """Station that returns readings newest first, like the live API, and respects the paging parameters"""
+
+    object_id = 'http://environment.data.gov.uk/flood-monitoring/id/stations/L0405'
+    measures = {MEASURE: dict(parameter='level')}
+
+    def __init__(self, timestamps, fail_offset: int = None):
+        """
+        :param fail_offset: Raise an HTTP error when this page is requested
+        """
+        self.timestamps = sorted(timestamps, reverse=True)
+        self.fail_offset = fail_offset
+        self.requests = list()
+
+    def readings(self, session, since, _limit, _offset=0):
+        self.requests.append(dict(since=since, _limit=_limit, _offset=_offset))
+        if _offset == self.fail_offset:
+            raise requests.HTTPError('503 Service Unavailable')
+        rows = [t for t in self.timestamps if t >= since][_offset:_offset + _limit]
+        for timestamp in rows:
+            yield dict(station=self.object_id, measure=MEASURE, timestamp=timestamp, value=1.0)
+
+
+class TestPoll(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.watermarks = poll.Watermarks(pathlib.Path(self.directory.name, 'watermarks.json'))
+        self.watermarks[MEASURE] = '2020-06-01T12:00:00+00:00'
+
+        self.batches = list()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def callback(self, rows):
+        # Watermarks must not move until the batch has been processed
+        self.assertEqual(self.watermarks[MEASURE], '2020-06-01T12:00:00+00:00')
+        self.batches.append([row['timestamp'] for row in rows])
+
+    def test_all_new_readings_are_retrieved(self):
+        station = FakeStation([
+            '2020-06-01T12:00:00+00:00',
+            '2020-06-01T12:15:00+00:00',
+            '2020-06-01T12:30:00+00:00',
+            '2020-06-01T12:45:00+00:00',
+        ])
+
+        count = poll.poll_once(None, stations=[station], watermarks=self.watermarks, callback=self.callback)
+
+        self.assertEqual(count, 3)
+        self.assertEqual(sorted(self.batches[0]), [
+            '2020-06-01T12:15:00+00:00',
+            '2020-06-01T12:30:00+00:00',
+            '2020-06-01T12:45:00+00:00',
+        ])
+        self.assertEqual(self.watermarks[MEASURE], '2020-06-01T12:45:00+00:00')
+
+    def test_readings_are_paged(self):
+        limit = settings.POLL_LIMIT
+        settings.POLL_LIMIT = 2
+        try:
+            station = FakeStation(['2020-06-01T12:{:02d}:00+00:00'.format(minute) for minute in range(1, 6)])
+            count = poll.poll_once(None, stations=[station], watermarks=self.watermarks, callback=self.callback)
+        finally:
+            settings.POLL_LIMIT = limit
+
+        self.assertEqual(count, 5)
+        self.assertEqual([request['_offset'] for request in station.requests], [0, 2, 4])
+        self.assertEqual(self.watermarks[MEASURE], '2020-06-01T12:05:00+00:00')
+
+    def test_failed_page_keeps_watermarks(self):
+        limit = settings.POLL_LIMIT
+        settings.POLL_LIMIT = 2
+        try:
+            timestamps = ['2020-06-01T12:{:02d}:00+00:00'.format(minute) for minute in range(1, 6)]
+
+            # The second page fails, after the newest readings have been received
+            station = FakeStation(timestamps, fail_offset=2)
+            with self.assertLogs(poll.LOGGER, 'ERROR'):
+                count = poll.poll_once(None, stations=[station], watermarks=self.watermarks, callback=self.callback)
+
+            self.assertEqual(count, 0)
+            self.assertEqual(self.watermarks[MEASURE], '2020-06-01T12:00:00+00:00')
+
+            # Every reading is retrieved on the next poll
+            station.fail_offset = None
+            count = poll.poll_once(None, stations=[station], watermarks=self.watermarks, callback=self.callback)
+        finally:
+            settings.POLL_LIMIT = limit
+
+        self.assertEqual(count, 5)
+        self.assertEqual(sorted(self.batches[0]), timestamps)
+
+    def test_watermarks_are_saved(self):
+        station = FakeStation(['2020-06-01T13:00:00+00:00'])
+        poll.poll_once(None, stations=[station], watermarks=self.watermarks, callback=self.callback)
+
+        watermarks = poll.Watermarks(self.watermarks.path)
+        watermarks.load()
+        self.assertEqual(watermarks, {MEASURE: '2020-06-01T13:00:00+00:00'})
+
+        # Nothing new on the next poll
+        self.assertEqual(
+            poll.poll_once(None, stations=[station], watermarks=watermarks, callback=self.callback), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
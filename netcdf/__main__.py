@@ -1,66 +1,247 @@
 import argparse
+import concurrent.futures
+import datetime
 import logging
 import itertools
 import json
-from typing import Iterable
+import pathlib
+import time
+import zlib
+from typing import Iterable, Iterator, Tuple
 from collections import OrderedDict
 
 from netCDF4 import Dataset
 
+import catalogue
+import export
 import remote
 
 LOGGER = logging.getLogger(__name__)
 
 REMOTE_HOST = 'ufdev.shef.ac.uk'
+DATA_DIR = '/home/uflo/data/dbData'
+DATA_FILES = DATA_DIR + '/**/**/**/*.nc'
+
+# Data files within the data directory (on a host where it's mounted)
+LOCAL_DATA_FILES = '*/*/*/*.nc'
+
+
+def parse_time(s: str) -> datetime.datetime:
+    """Parse an ISO date or date and time (local time)"""
+    for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(s, fmt)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError("Invalid time '{}'".format(s))
 
 
 def get_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
     parser.add_argument('-v', '--verbose', action='store_true')
-    parser.add_argument('-u', '--username', help='Username on remote host', required=True)
+    parser.add_argument('-u', '--username', help='Username on remote host (required unless --local is used)')
     parser.add_argument('-t', '--timeout', type=int, help='time in milliseconds for how long a blocking call may wait')
     parser.add_argument('-r', '--host', default=REMOTE_HOST, help='Remote host name')
     parser.add_argument('-p', '--port', type=int, default=22)
-    return parser.parse_args()
+    parser.add_argument('-z', '--compress', type=int, nargs='?', const=1, metavar='LEVEL',
+                        help='Compress files on the remote host before transferring them (gzip level 1-9, default 1)')
+    parser.add_argument('-c', '--channels', type=int, default=1,
+                        help='Number of files to transfer at once (over separate channels in the same SSH session)')
+
+    # Local files
+    parser.add_argument('-l', '--local', type=pathlib.Path, nargs='?', const=DATA_DIR, metavar='DIRECTORY',
+                        help='Read files directly from the data directory on this host (default {})'.format(DATA_DIR))
+    parser.add_argument('-s', '--since', type=parse_time,
+                        help='Only read local files modified after this time (YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS)')
+
+    # Catalogue
+    parser.add_argument('-i', '--index', metavar='CATALOGUE',
+                        help='Record the metadata of new or changed files in a catalogue (SQLite database) instead of '
+                             'reading the data')
+
+    # Columnar export
+    parser.add_argument('-e', '--export', choices=export.FORMATS, help='Write each data set to a file in this format')
+    parser.add_argument('-o', '--output', type=pathlib.Path, default='export', help='Export directory')
+    parser.add_argument('-d', '--dimension', help='Name of the dimension that indexes the rows of exported data')
+    parser.add_argument('-b', '--block_size', type=int, default=export.DEFAULT_BLOCK_SIZE,
+                        help='Number of rows to export at once')
+
+    args = parser.parse_args()
+
+    if not args.local and not args.username:
+        parser.error('the following arguments are required: -u/--username')
+
+    return args
 
 
-def get_data_files(host: remote.RemoteHost) -> Iterable[bytes]:
+def list_data_files(host: remote.RemoteHost) -> list:
     """
-    Retrieve binary data files from remote host
+    Get full paths of all netCDF files
     """
+    paths = str().join(host.execute_decode('ls -d {}'.format(DATA_FILES)))
+    return paths.split()
 
-    # Get full paths of all netCDF files
-    paths = str().join(host.execute_decode('ls -d /home/uflo/data/dbData/**/**/**/*.nc'))
-    for path in paths.split():
-        LOGGER.info(path)
 
-        # Save remote data to memory as binary object
-        yield bytes().join(host.execute('cat {}'.format(path)))
+def stat_data_files(host: remote.RemoteHost) -> list:
+    """
+    Get full paths, sizes (bytes) and modification times (seconds) of all netCDF files
+    """
+    lines = str().join(host.execute_decode("stat -c '%n %s %Y' {}".format(DATA_FILES))).splitlines()
+    return [(path, int(size), float(mtime)) for path, size, mtime in (line.rsplit(maxsplit=2) for line in lines)]
+
+
+def prefetch(files: Iterator[Tuple[str, bytes]]) -> Iterable[Tuple[str, bytes]]:
+    """
+    Receive the next file in a background thread while the current one is being processed
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(next, files, None)
+
+        while True:
+            item = future.result()
+            if item is None:
+                return
+
+            future = executor.submit(next, files, None)
+            yield item
+
 
+def gzip_decompressor():
+    """Incremental decoder for gzip data"""
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
 
-def get_datasets(host) -> Iterable[Dataset]:
+
+def decompress(chunks: Iterable[bytes], decompressor) -> Iterable[bytes]:
+    for chunk in chunks:
+        yield decompressor.decompress(chunk)
+    yield decompressor.flush()
+
+
+def log_transfer(files: int, size: int, received: int, elapsed: float):
     """
-    Load netCDF files using API
+    Show transfer statistics
+
+    :param size: Amount of data (bytes)
+    :param received: Amount transferred (bytes)
+    :param elapsed: Duration (seconds)
     """
-    for buffer in get_data_files(host):
+    saved = 1 - received / size if size else 0
+    throughput = size / elapsed if elapsed else 0
+
+    LOGGER.info("Transferred %s files (%s bytes) in %.1fs: received %s bytes (%.0f%% saved), %.2f MB/s", files, size,
+                elapsed, received, 100 * saved, throughput / 1e6)
+
+
+def get_data_files(host: remote.RemoteHost, channels: int = 1, compress: int = None,
+                   paths: list = None) -> Iterable[Tuple[str, bytes]]:
+    """
+    Retrieve binary data files (path and contents) from remote host
+
+    :param channels: Number of files to transfer at once. If more than one, the next file is transferred in a
+                     background thread while the previous one is being processed, in the order that they finish.
+    :param compress: gzip compression level. If specified, files are compressed on the remote host and decompressed
+                     as they're received.
+    :param paths: Files to retrieve (default: all)
+    """
+    if paths is None:
+        paths = list_data_files(host)
+
+    command_format = 'gzip -{} -c {{}}'.format(compress) if compress else 'cat {}'
+    decoder = gzip_decompressor if compress else None
+
+    start = time.monotonic()
+    bytes_received = host.bytes_received
+    total_size = 0
+
+    if channels > 1:
+        commands = ((path, command_format.format(path)) for path in paths)
+        files = host.execute_many(commands, channels=channels, decoder=decoder)
+
+        for path, buffer in prefetch(files):
+            LOGGER.info(path)
+            total_size += len(buffer)
+            yield path, buffer
+
+    else:
+        for path in paths:
+            LOGGER.info(path)
+
+            # Save remote data to memory as binary object
+            chunks = host.execute(command_format.format(path))
+            if decoder:
+                chunks = decompress(chunks, decoder())
+
+            buffer = bytes().join(chunks)
+            total_size += len(buffer)
+            yield path, buffer
+
+    log_transfer(files=len(paths), size=total_size, received=host.bytes_received - bytes_received,
+                 elapsed=time.monotonic() - start)
+
+
+def log_metadata(dataset: Dataset):
+    # Show metadata
+    LOGGER.info("Metadata: %s", json.dumps(dataset.__dict__))
+    LOGGER.info('Dimensions: %s', json.dumps(list(dataset.dimensions.keys())))
+    LOGGER.info('Variables: %s', json.dumps(list(dataset.variables.keys())))
+
+    dtypes = {name: var.dtype for name, var in dataset.variables.items()}
+    LOGGER.info('Data types: %s', dtypes)
+
+
+def get_datasets(host, channels: int = 1, compress: int = None, paths: list = None) -> Iterable[Tuple[str, Dataset]]:
+    """
+    Load netCDF files (path and data set) using API
+    """
+    for path, buffer in get_data_files(host, channels=channels, compress=compress, paths=paths):
         # Create data set in memory (don't store to disk)
         with Dataset('in-mem-file', mode='r', memory=buffer) as dataset:
-            # Show metadata
-            LOGGER.info("Metadata: %s", json.dumps(dataset.__dict__))
-            LOGGER.info('Dimensions: %s', json.dumps(list(dataset.dimensions.keys())))
-            LOGGER.info('Variables: %s', json.dumps(list(dataset.variables.keys())))
+            log_metadata(dataset)
 
-            dtypes = {name: var.dtype for name, var in dataset.variables.items()}
-            LOGGER.info('Data types: %s', dtypes)
+            yield path, dataset
 
-            yield dataset
 
+def list_local_files(directory: pathlib.Path, since: datetime.datetime = None) -> list:
+    """
+    Find the netCDF files in a local directory, optionally only those modified after a certain time
+    """
+    paths = sorted(pathlib.Path(directory).glob(LOCAL_DATA_FILES))
+    LOGGER.info("Found %s files in '%s'", len(paths), directory)
 
-def get_data_rows(host) -> Iterable[OrderedDict]:
+    if since:
+        paths = [path for path in paths if path.stat().st_mtime > since.timestamp()]
+        LOGGER.info("%s files modified since %s", len(paths), since)
+
+    return paths
+
+
+def get_local_datasets(directory: pathlib.Path, since: datetime.datetime = None,
+                       paths: list = None) -> Iterable[Tuple[str, Dataset]]:
+    """
+    Open local netCDF files (path and data set)
+
+    The files are opened directly so that only the headers are read at first. Variable data is read when it's accessed
+    (through the operating system's page cache) rather than loading each whole file into memory.
+
+    :param paths: Files to open (default: all the files in the directory)
+    """
+    if paths is None:
+        paths = list_local_files(directory, since=since)
+
+    for path in paths:
+        LOGGER.info(path)
+
+        with Dataset(str(path), mode='r') as dataset:
+            log_metadata(dataset)
+
+            yield str(path), dataset
+
+
+def get_data_rows(datasets: Iterable[Tuple[str, Dataset]]) -> Iterable[OrderedDict]:
     """
     Convert netCDF data sets into multiple dictionaries (one dictionary per row)
     """
-    for dataset in get_datasets(host):
+    for _, dataset in datasets:
         # Column headers (variable names)
         headers = dataset.variables.keys()
 
@@ -114,20 +295,83 @@ def numpy_to_native(row: dict) -> Iterable[tuple]:
             yield key, [b.decode() for b in value]
 
 
+def export_path(directory: pathlib.Path, path: str, fmt: str, data_dir: str = DATA_DIR) -> pathlib.Path:
+    """Output file path, in the same directory structure as the data files"""
+    relative = pathlib.PurePosixPath(path).relative_to(data_dir)
+    return directory.joinpath(*relative.parts).with_suffix('.' + fmt)
+
+
+def export_datasets(datasets: Iterable[Tuple[str, Dataset]], directory: pathlib.Path, fmt: str, dimension: str = None,
+                    block_size: int = export.DEFAULT_BLOCK_SIZE, data_dir: str = DATA_DIR):
+    """
+    Write each data set to a file in a columnar format
+    """
+    for path, dataset in datasets:
+        export.export(dataset, path=export_path(directory, path, fmt=fmt, data_dir=data_dir), fmt=fmt,
+                      dimension=dimension, block_size=block_size)
+
+
+def process(args, datasets: Iterable[Tuple[str, Dataset]], data_dir: str):
+    if args.export:
+        export_datasets(datasets, directory=args.output, fmt=args.export, dimension=args.dimension,
+                        block_size=args.block_size, data_dir=data_dir)
+        return
+
+    for row in get_data_rows(datasets):
+        try:
+            # Convert to Python native data type
+            row = dict(numpy_to_native(row))
+        except (ValueError, TypeError) as exc:
+            LOGGER.error(exc)
+            LOGGER.error(row)
+            raise
+        print(json.dumps(row))
+
+
+def build_index(path: str, files: list, get: callable):
+    """
+    Add new or changed files to the catalogue
+
+    :param files: Path, size and modification time of all the data files
+    :param get: Function get(paths) that generates (path, data set) pairs
+    """
+    with catalogue.Catalogue(path) as index:
+        index.remove_missing(str(file_path) for file_path, _, _ in files)
+
+        stats = {str(file_path): (size, mtime) for file_path, size, mtime in files}
+        changed = [file_path for file_path, (size, mtime) in stats.items()
+                   if not index.is_current(file_path, size=size, mtime=mtime)]
+        LOGGER.info("%s of %s files are new or changed", len(changed), len(stats))
+
+        for file_path, dataset in get(changed):
+            size, mtime = stats[file_path]
+            index.add(file_path, size=size, mtime=mtime, dataset=dataset)
+
+        LOGGER.info("Catalogue '%s' contains %s files", path, len(index))
+
+
 def main():
     args = get_args()
     logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
 
+    if args.local:
+        directory = args.local.resolve()
+
+        if args.index:
+            files = [(path, path.stat().st_size, path.stat().st_mtime) for path in list_local_files(directory)]
+            build_index(args.index, files=files, get=lambda paths: get_local_datasets(directory, paths=paths))
+            return
+
+        process(args, get_local_datasets(directory, since=args.since), data_dir=str(directory))
+        return
+
     with remote.RemoteHost(args.host, args.port, username=args.username, timeout=args.timeout) as host:
-        for row in get_data_rows(host):
-            try:
-                # Convert to Python native data type
-                row = dict(numpy_to_native(row))
-            except (ValueError, TypeError) as exc:
-                LOGGER.error(exc)
-                LOGGER.error(row)
-                raise
-            print(json.dumps(row))
+        if args.index:
+            build_index(args.index, files=stat_data_files(host), get=lambda paths: get_datasets(
+                host, channels=args.channels, compress=args.compress, paths=paths))
+            return
+
+        process(args, get_datasets(host, channels=args.channels, compress=args.compress), data_dir=DATA_DIR)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,224 @@
+"""
+Catalogue of netCDF files
+
+The metadata of each file (size, modification time, global attributes, dimensions, variables and the time range that it
+covers) is recorded in a local SQLite database so that the files that contain the data of interest can be found without
+opening every file. Only the file headers and the first and last values of the time variable are read.
+
+Usage:
+python catalogue.py catalogue.sqlite --match <sensor> --start 2020-06-01 --end 2020-07-01
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import sqlite3
+
+import numpy
+from netCDF4 import num2date
+
+LOGGER = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    time_start TEXT,
+    time_end TEXT,
+    attributes TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dimension (
+    path TEXT NOT NULL REFERENCES file (path) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    unlimited INTEGER NOT NULL,
+    PRIMARY KEY (path, name)
+);
+CREATE TABLE IF NOT EXISTS variable (
+    path TEXT NOT NULL REFERENCES file (path) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    dimensions TEXT NOT NULL,
+    shape TEXT NOT NULL,
+    dtype TEXT NOT NULL,
+    units TEXT,
+    PRIMARY KEY (path, name)
+);
+CREATE INDEX IF NOT EXISTS file_time ON file (time_start, time_end);
+CREATE INDEX IF NOT EXISTS variable_name ON variable (name);
+"""
+
+
+def to_json(value):
+    """Convert NumPy attribute values to native types"""
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    if isinstance(value, numpy.generic):
+        return value.item()
+    if isinstance(value, bytes):
+        return value.decode()
+    return value
+
+
+def get_time_variable(dataset):
+    """Find the time coordinate variable (named 'time' or with units like 'seconds since 1970-01-01')"""
+    variable = dataset.variables.get('time')
+    if variable is not None:
+        return variable
+
+    for variable in dataset.variables.values():
+        if ' since ' in str(getattr(variable, 'units', '')) and variable.ndim == 1:
+            return variable
+
+    return None
+
+
+def get_time_range(dataset) -> tuple:
+    """
+    Time of the first and last values of the time variable (ISO format) assuming they're in order, or None
+    """
+    variable = get_time_variable(dataset)
+
+    if variable is None or not variable.size:
+        return None, None
+
+    # Only read the ends of the array
+    first, last = variable[0], variable[-1]
+    if numpy.ma.is_masked(first) or numpy.ma.is_masked(last) or not hasattr(variable, 'units'):
+        return None, None
+
+    times = num2date(numpy.array([first, last]), units=variable.units,
+                     calendar=getattr(variable, 'calendar', 'standard'))
+
+    return tuple(time.isoformat() for time in times)
+
+
+class Catalogue:
+    """
+    SQLite database of netCDF file metadata
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(str(path))
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM file").fetchone()[0]
+
+    def is_current(self, path: str, size: int, mtime: float) -> bool:
+        """Whether the file is already catalogued and hasn't changed since"""
+        row = self.connection.execute("SELECT size, mtime FROM file WHERE path = ?", (path,)).fetchone()
+        return row is not None and tuple(row) == (size, mtime)
+
+    def add(self, path: str, size: int, mtime: float, dataset):
+        """Record (or replace) the metadata of one file"""
+        time_start, time_end = get_time_range(dataset)
+        attributes = {key: to_json(value) for key, value in dataset.__dict__.items()}
+
+        with self.connection:
+            self.connection.execute("DELETE FROM file WHERE path = ?", (path,))
+            self.connection.execute(
+                "INSERT INTO file (path, size, mtime, time_start, time_end, attributes) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, size, mtime, time_start, time_end, json.dumps(attributes)))
+            self.connection.executemany(
+                "INSERT INTO dimension (path, name, size, unlimited) VALUES (?, ?, ?, ?)",
+                ((path, name, len(dimension), dimension.isunlimited())
+                 for name, dimension in dataset.dimensions.items()))
+            self.connection.executemany(
+                "INSERT INTO variable (path, name, dimensions, shape, dtype, units) VALUES (?, ?, ?, ?, ?, ?)",
+                ((path, name, json.dumps(variable.dimensions), json.dumps(variable.shape), str(variable.dtype),
+                  to_json(getattr(variable, 'units', None)))
+                 for name, variable in dataset.variables.items()))
+
+        LOGGER.info("Catalogued '%s' (%s to %s)", path, time_start, time_end)
+
+    def remove_missing(self, paths) -> int:
+        """
+        Remove the files that aren't in the list of paths
+
+        :returns: Number of files removed
+        """
+        paths = set(paths)
+        missing = [path for path, in self.connection.execute("SELECT path FROM file") if path not in paths]
+
+        with self.connection:
+            self.connection.executemany("DELETE FROM file WHERE path = ?", ((path,) for path in missing))
+
+        for path in missing:
+            LOGGER.info("Removed '%s'", path)
+
+        return len(missing)
+
+    def find(self, match: str = None, start: datetime.datetime = None, end: datetime.datetime = None,
+             variable: str = None) -> list:
+        """
+        Find the files that match the criteria
+
+        :param match: Text in the file path or global attributes e.g. a sensor identifier
+        :param start: Files that contain data at or after this time
+        :param end: Files that contain data before this time
+        :param variable: Files that contain this variable
+        :returns: Paths
+        """
+        conditions = list()
+        parameters = list()
+
+        if match:
+            conditions.append("(file.path LIKE ? OR file.attributes LIKE ?)")
+            parameters.extend(['%{}%'.format(match)] * 2)
+        if start:
+            conditions.append("file.time_end >= ?")
+            parameters.append(start.isoformat())
+        if end:
+            conditions.append("file.time_start < ?")
+            parameters.append(end.isoformat())
+        if variable:
+            conditions.append("EXISTS (SELECT 1 FROM variable WHERE variable.path = file.path AND variable.name = ?)")
+            parameters.append(variable)
+
+        query = "SELECT path FROM file"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY time_start, path"
+
+        return [path for path, in self.connection.execute(query, parameters)]
+
+
+def parse_date(s: str) -> datetime.datetime:
+    return datetime.datetime.strptime(s, '%Y-%m-%d')
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Find netCDF files in a catalogue')
+    parser.add_argument('catalogue', help='Catalogue file path')
+    parser.add_argument('-m', '--match', help='Text in the file path or global attributes e.g. sensor identifier')
+    parser.add_argument('-s', '--start', type=parse_date, help='Files with data on or after this date (YYYY-MM-DD)')
+    parser.add_argument('-e', '--end', type=parse_date, help='Files with data before this date (YYYY-MM-DD)')
+    parser.add_argument('-n', '--variable', help='Files that contain this variable')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    with Catalogue(args.catalogue) as catalogue:
+        for path in catalogue.find(match=args.match, start=args.start, end=args.end, variable=args.variable):
+            print(path)
+
+
+if __name__ == '__main__':
+    main()
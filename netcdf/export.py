@@ -0,0 +1,179 @@
+"""
+Export netCDF data sets in columnar blocks
+
+Each variable is read as a NumPy array slice (one block of rows at a time) and converted to native Python values in one
+operation per column, rather than building a dictionary for every row.
+
+Rows are indexed by one dimension (by default the unlimited dimension, or else the first dimension of the first
+variable). Variables that use that dimension become columns:
+
+* one-dimensional variables are a single column;
+* character arrays (dtype S1) with a second dimension for the string length are decoded into one text column;
+* other variables with extra dimensions are split into one column per element e.g. name[0], name[1].
+
+Variables that don't use the row dimension (e.g. scalars) are skipped.
+"""
+
+import csv
+import json
+import logging
+import pathlib
+
+import numpy
+
+LOGGER = logging.getLogger(__name__)
+
+# Number of rows to read and write at once
+DEFAULT_BLOCK_SIZE = 10000
+
+FORMATS = ('csv', 'ndjson', 'parquet')
+
+
+def get_row_dimension(dataset) -> str:
+    """Choose the dimension that indexes the rows"""
+    for name, dimension in dataset.dimensions.items():
+        if dimension.isunlimited():
+            return name
+
+    for variable in dataset.variables.values():
+        if variable.dimensions:
+            return variable.dimensions[0]
+
+    raise ValueError('No dimensions')
+
+
+def is_char_array(variable) -> bool:
+    """Character variables hold one character per row or (with a second dimension) one string per row"""
+    return variable.dtype == numpy.dtype('S1') and len(variable.dimensions) in {1, 2}
+
+
+def decode_chars(array: numpy.ndarray) -> numpy.ndarray:
+    """Join character arrays (rows of S1 values) into strings, or decode single characters"""
+    array = numpy.ma.getdata(array)
+    if array.ndim == 1:
+        return numpy.char.decode(array, 'utf-8')
+    strings = numpy.ascontiguousarray(array).view('S{}'.format(array.shape[1])).reshape(-1)
+    return numpy.char.decode(strings, 'utf-8')
+
+
+class Table:
+    """
+    Columns of a data set along one dimension
+    """
+
+    def __init__(self, dataset, dimension: str = None):
+        self.dataset = dataset
+        self.dimension = dimension or get_row_dimension(dataset)
+        self.length = len(dataset.dimensions[self.dimension])
+
+        # Variables to read
+        self.variables = list()
+
+        for name, variable in dataset.variables.items():
+            if not variable.dimensions or variable.dimensions[0] != self.dimension:
+                LOGGER.info("Skipping variable '%s' %s (not indexed by '%s')", name, variable.dimensions,
+                            self.dimension)
+                continue
+
+            self.variables.append(variable)
+
+        LOGGER.info("Dimension '%s': %s rows, %s columns", self.dimension, self.length, len(self.headers))
+
+    @property
+    def headers(self) -> list:
+        headers = list()
+        for variable in self.variables:
+            if variable.ndim == 1 or is_char_array(variable):
+                headers.append(variable.name)
+            else:
+                size = int(numpy.prod(variable.shape[1:]))
+                headers.extend('{}[{}]'.format(variable.name, i) for i in range(size))
+        return headers
+
+    def read_block(self, start: int, stop: int) -> list:
+        """
+        Read a block of rows
+
+        :returns: Columns (lists of native Python values, with None for missing values)
+        """
+        columns = list()
+
+        for variable in self.variables:
+            array = variable[start:stop]
+
+            if is_char_array(variable):
+                # The netCDF library may have decoded the strings already (if the variable has an _Encoding)
+                if array.dtype == numpy.dtype('S1'):
+                    array = decode_chars(array)
+                columns.append(array.tolist())
+
+            elif variable.ndim == 1:
+                # Masked values are converted to None
+                columns.append(array.tolist())
+
+            else:
+                array = array.reshape(array.shape[0], -1)
+                columns.extend(array[:, i].tolist() for i in range(array.shape[1]))
+
+        return columns
+
+    def blocks(self, block_size: int = DEFAULT_BLOCK_SIZE) -> iter:
+        for start in range(0, self.length, block_size):
+            yield self.read_block(start, min(start + block_size, self.length))
+
+
+def write_csv(table: Table, path: pathlib.Path, block_size: int = DEFAULT_BLOCK_SIZE):
+    with path.open('w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(table.headers)
+
+        for columns in table.blocks(block_size):
+            writer.writerows(zip(*columns))
+
+
+def write_ndjson(table: Table, path: pathlib.Path, block_size: int = DEFAULT_BLOCK_SIZE):
+    headers = table.headers
+    with path.open('w') as file:
+        for columns in table.blocks(block_size):
+            file.writelines(json.dumps(dict(zip(headers, row))) + '\n' for row in zip(*columns))
+
+
+def write_parquet(table: Table, path: pathlib.Path, block_size: int = DEFAULT_BLOCK_SIZE):
+    """Write one row group per block (requires pyarrow)"""
+    import pyarrow
+    import pyarrow.parquet
+
+    writer = None
+    try:
+        for columns in table.blocks(block_size):
+            block = pyarrow.Table.from_arrays([pyarrow.array(column) for column in columns], names=table.headers)
+
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(str(path), block.schema)
+
+            writer.write_table(block)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+WRITERS = dict(
+    csv=write_csv,
+    ndjson=write_ndjson,
+    parquet=write_parquet,
+)
+
+
+def export(dataset, path: pathlib.Path, fmt: str, dimension: str = None, block_size: int = DEFAULT_BLOCK_SIZE):
+    """
+    Write a data set to a file
+
+    :param fmt: Output format (csv, ndjson or parquet)
+    :param dimension: Name of the dimension that indexes the rows
+    """
+    table = Table(dataset, dimension=dimension)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    WRITERS[fmt](table, path, block_size=block_size)
+
+    LOGGER.info("Wrote '%s'", path)
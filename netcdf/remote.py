@@ -1,17 +1,19 @@
 import logging
+import select
 import socket
 from getpass import getpass
 from typing import Iterable, Tuple
 
 import ssh2.channel
 import ssh2.session
+from ssh2.error_codes import LIBSSH2_ERROR_EAGAIN
 
 LOGGER = logging.getLogger(__name__)
 
 
 class RemoteHost:
     """
-    Connect to a remote host and run one SSH command at a time.
+    Connect to a remote host and run SSH commands, either one at a time or several at once over separate channels.
     """
 
     def __init__(self, host: str, port: int, username: str, timeout: int = None):
@@ -19,6 +21,10 @@ class RemoteHost:
         self.port = port
         self.username = username
         self.timeout = timeout or 0
+
+        # Total amount of data received
+        self.bytes_received = 0
+
         self._socket = None
         self._session = None
 
@@ -67,8 +73,7 @@ class RemoteHost:
 
         return self._session
 
-    @classmethod
-    def read(cls, channel: ssh2.channel.Channel, stderr: bool = False) -> Iterable[bytes]:
+    def read(self, channel: ssh2.channel.Channel, stderr: bool = False) -> Iterable[bytes]:
         """
         Read (stream) channel response
 
@@ -87,6 +92,7 @@ class RemoteHost:
                 break
             else:
                 total_size += size
+                self.bytes_received += size
                 yield data
 
         LOGGER.info('Retrieved %s bytes', total_size)
@@ -124,3 +130,125 @@ class RemoteHost:
         """
         for data in self.execute(*args, **kwargs):
             yield data.decode()
+
+    def wait_socket(self):
+        """
+        Wait until the session can continue (non-blocking mode)
+        """
+        directions = self.session.block_directions()
+
+        # Wait for data to arrive by default
+        inbound = not directions or directions & ssh2.session.LIBSSH2_SESSION_BLOCK_INBOUND
+        readable = [self.socket] if inbound else list()
+        writable = [self.socket] if directions & ssh2.session.LIBSSH2_SESSION_BLOCK_OUTBOUND else list()
+
+        select.select(readable, writable, list(), self.timeout / 1000 if self.timeout else None)
+
+    def retry(self, func, *args):
+        """
+        Call a session or channel function until it doesn't need to wait (non-blocking mode)
+        """
+        result = func(*args)
+        while result == LIBSSH2_ERROR_EAGAIN:
+            self.wait_socket()
+            result = func(*args)
+        return result
+
+    def start(self, command: str) -> ssh2.channel.Channel:
+        """
+        Open a channel and run a command on it (non-blocking mode)
+        """
+        channel = self.retry(self.session.open_session)
+
+        LOGGER.debug("Command %s", repr(command))
+
+        self.retry(channel.execute, command)
+
+        return channel
+
+    def finish(self, channel: ssh2.channel.Channel):
+        """
+        Close a channel that has reached the end of its output (non-blocking mode) and check the exit status
+        """
+        self.retry(channel.close)
+        self.retry(channel.wait_closed)
+
+        exit_status = channel.get_exit_status()
+        LOGGER.debug("Exit status: %s", exit_status)
+
+        # Errors
+        if exit_status:
+            size, data = self.retry(channel.read_stderr)
+            while size > 0:
+                LOGGER.error(data)
+                size, data = self.retry(channel.read_stderr)
+            raise RuntimeError(exit_status)
+
+    def execute_many(self, commands: Iterable[Tuple[object, str]], channels: int = 4,
+                     decoder=None) -> Iterable[Tuple[object, bytes]]:
+        """
+        Run several commands at once, each one on its own channel in the same session. The output of all the channels
+        is read as it arrives (so the transfers overlap) and each command's output is returned when it's complete.
+
+        The session is used in non-blocking mode until all the commands have finished, so it mustn't be used for
+        anything else in the meantime.
+
+        :param commands: Pairs of (key, command)
+        :param channels: Maximum number of commands to run at once
+        :param decoder: Function that returns a new decompressor (with decompress() and flush() methods like
+                        zlib.decompressobj) to decode each command's output as it arrives
+        :returns: Pairs of (key, output) in the order that the commands finish
+        """
+        commands = iter(commands)
+
+        # Output received so far by each channel
+        active = dict()
+
+        self.session.set_blocking(False)
+        try:
+            while True:
+                # Start new commands
+                while len(active) < channels:
+                    try:
+                        key, command = next(commands)
+                    except StopIteration:
+                        break
+
+                    active[self.start(command)] = key, list(), decoder() if decoder else None
+
+                if not active:
+                    break
+
+                received = False
+                for channel, (key, chunks, decompressor) in list(active.items()):
+                    # Read everything that's available on this channel
+                    size, data = channel.read()
+                    while size > 0:
+                        self.bytes_received += size
+                        chunks.append(decompressor.decompress(data) if decompressor else data)
+                        received = True
+                        size, data = channel.read()
+
+                    # Negative values are error codes
+                    if size < 0 and size != LIBSSH2_ERROR_EAGAIN:
+                        raise RuntimeError(size, data)
+
+                    if not channel.eof():
+                        continue
+
+                    self.finish(channel)
+                    del active[channel]
+
+                    if decompressor:
+                        chunks.append(decompressor.flush())
+
+                    output = bytes().join(chunks)
+                    LOGGER.info('Retrieved %s bytes', len(output))
+
+                    yield key, output
+
+                # Wait for more data to arrive on any channel
+                if not received:
+                    self.wait_socket()
+        finally:
+            self.session.set_blocking(True)
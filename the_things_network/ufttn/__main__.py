@@ -4,14 +4,28 @@ Retrieve data
 
 import logging
 import argparse
+import concurrent.futures
+import itertools
 import json
+import os.path
+import queue
+
+import requests.adapters
 
 import utils
+import store
 import transform
 import http_session
+import objects
 
 LOGGER = logging.getLogger(__name__)
 
+# Number of devices to query at once
+DEFAULT_WORKERS = 4
+
+# Maximum number of data points received but not yet stored
+BUFFER_SIZE = 10000
+
 DESCRIPTION = """
 Download data from The Things Network Data Storage integration via its web API.
 """
@@ -30,12 +44,21 @@ def get_args():
     parser.add_argument('-d', '--date', type=utils.parse_date, required=True, help='Temporal filter YYYY-MM-DD')
     parser.add_argument('-r', '--raw', default='raw', type=str, help="Raw data output directory")
     parser.add_argument('-f', '--header', default=False, type=bool, help="Write CSV field header row")
+    parser.add_argument('-s', '--store', default='store.sqlite', type=str,
+                        help="Local data store file path (relative to the root data directory)")
+    parser.add_argument('-l', '--last', type=str,
+                        help="Duration to query e.g. 7d (by default, the time since the newest stored point)")
+    parser.add_argument('-e', '--devices', action='store_true',
+                        help="Query each device separately (several at once) and stream the responses")
+    parser.add_argument('-w', '--workers', default=DEFAULT_WORKERS, type=int, help="Number of devices to query at once")
 
     return parser.parse_args()
 
 
-def download_data(session, path: str) -> str:
-    data = session.query_raw(last='7d').text
+def download_data(session, path: str, last: str = '7d') -> str:
+    LOGGER.info("Querying the last %s", last)
+
+    data = session.query_raw(last=last).text
 
     # Serialise
     with open(path, 'w') as file:
@@ -47,9 +70,76 @@ def download_data(session, path: str) -> str:
 
 
 def parse_data(data: str) -> list:
+    # No content
+    if not data:
+        return list()
+
     return json.loads(data)
 
 
+def query_device(session, device_id: str, last: str, path: str, points: queue.Queue):
+    """
+    Stream one device's data points into a queue, saving the raw response
+    """
+    LOGGER.info("Device '%s': querying the last %s", device_id, last)
+
+    count = 0
+    with open(path, 'w') as file:
+        for point in objects.Device.iter_query(session, device_id=device_id, last=last, file=file):
+            points.put(point)
+            count += 1
+
+        LOGGER.info("Wrote '%s'", file.name)
+
+    LOGGER.info("Device '%s': retrieved %s rows", device_id, count)
+
+
+def harvest_devices(session, data_store, root_dir: str, raw_dir: str, date, last: str = None,
+                    workers: int = DEFAULT_WORKERS):
+    """
+    Query each device separately, several at a time, and save the data points in the store as they're received. The
+    points are passed through a bounded queue so that only a limited number are held in memory at once.
+
+    :param last: Duration to query (by default, the time since each device's newest stored point)
+    """
+    devices = objects.Device.list(session)
+    LOGGER.info("Found %s devices", len(devices))
+
+    # Share the connection pool between the threads
+    session.mount(session.base_url, requests.adapters.HTTPAdapter(pool_maxsize=workers))
+
+    points = queue.Queue(maxsize=BUFFER_SIZE)
+    done = object()
+
+    def run(device_id: str, device_last: str):
+        try:
+            path = utils.build_path(root_dir=root_dir, sub_dir=raw_dir, date=date, ext='{}.json'.format(device_id))
+            query_device(session, device_id=device_id, last=device_last, path=path, points=points)
+        finally:
+            points.put(done)
+
+    def receive():
+        remaining = len(devices)
+        while remaining:
+            point = points.get()
+            if point is done:
+                remaining -= 1
+            else:
+                yield point
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run, device_id, last or data_store.window(device_id=device_id))
+            for device_id in devices
+        ]
+
+        data_store.add(receive())
+
+        # Raise any errors
+        for future in futures:
+            future.result()
+
+
 def main():
     args = get_args()
     config = utils.get_config(args.config)
@@ -59,18 +149,32 @@ def main():
 
     root_dir = config['data']['root_dir']
 
-    raw_path = utils.build_path(root_dir=root_dir, sub_dir=args.raw, date=args.date, ext='json')
-    data = download_data(session, path=raw_path)
+    with store.Store(os.path.join(root_dir, args.store)) as data_store:
+        # Only retrieve data that isn't already stored
+        if args.devices:
+            harvest_devices(session, data_store=data_store, root_dir=root_dir, raw_dir=args.raw, date=args.date,
+                            last=args.last, workers=args.workers)
+        else:
+            raw_path = utils.build_path(root_dir=root_dir, sub_dir=args.raw, date=args.date, ext='json')
+            data = download_data(session, path=raw_path, last=args.last or data_store.window())
+
+            rows = parse_data(data)
+
+            LOGGER.info("Retrieved %s rows", len(rows))
 
-    rows = parse_data(data)
+            data_store.add(rows)
 
-    LOGGER.info("Retrieved %s rows", len(rows))
+        headers = utils.get_headers(config['fields'])
+        points = data_store.get_date(args.date)
 
-    headers = utils.get_headers(config['fields'])
-    rows = transform.clean(rows, data_types=headers, date=args.date)
+        # The metric columns are in the same order as the fields of the first data point
+        first = next(points, dict())
+        columns = transform.get_columns(first)
+        rows = transform.clean(itertools.chain([first] if first else [], points), data_types=headers, date=args.date,
+                               columns=columns)
 
-    output_path = utils.build_path(root_dir=root_dir, sub_dir=args.output, date=args.date, ext='csv')
-    utils.write_csv(path=output_path, rows=rows, header=args.header)
+        output_path = utils.build_path(root_dir=root_dir, sub_dir=args.output, date=args.date, ext='csv')
+        utils.write_csv(path=output_path, rows=rows, columns=columns, header=args.header)
 
 
 if __name__ == '__main__':
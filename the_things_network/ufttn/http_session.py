@@ -7,6 +7,9 @@ import requests
 
 LOGGER = logging.getLogger(__name__)
 
+# Size of the pieces of streamed responses (bytes)
+CHUNK_SIZE = 2 ** 16
+
 
 class StorageSession(requests.Session):
     """
@@ -69,6 +72,29 @@ class StorageSession(requests.Session):
 
         return data
 
+    def call_iter(self, endpoint: str, file=None, **kwargs) -> iter:
+        """
+        Call an API endpoint that returns a JSON array of objects and generate the objects as they are received,
+        without loading the whole response into memory
+
+        :param file: Optional text file to write the raw response to
+        """
+        url = urllib.parse.urljoin(self.base_url, endpoint)
+
+        with self.get(url, stream=True, **kwargs) as response:
+            if response.status_code == http.HTTPStatus.NO_CONTENT:
+                return
+
+            if response.encoding is None:
+                response.encoding = 'utf-8'
+
+            chunks = response.iter_content(chunk_size=CHUNK_SIZE, decode_unicode=True)
+
+            if file is not None:
+                chunks = tee(chunks, file)
+
+            yield from iter_json_objects(chunks)
+
     def query_raw(self, last: str = None):
         """
         https://mj-ttgopaxcounter.data.thethingsnetwork.org/#!/query/get_api_v2_query
@@ -81,3 +107,43 @@ class StorageSession(requests.Session):
 
     def query(self, *args, **kwargs) -> list:
         return self.query_raw(*args, **kwargs).json()
+
+
+def tee(chunks, file) -> iter:
+    """Write each piece of text to a file as it passes through"""
+    for chunk in chunks:
+        file.write(chunk)
+        yield chunk
+
+
+def iter_json_objects(chunks) -> iter:
+    """
+    Incrementally decode the data points (JSON objects) in a query response array from pieces of text
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+
+    for chunk in chunks:
+        buffer += chunk
+        position = 0
+
+        while True:
+            # Skip the array brackets and separators
+            start = buffer.find('{', position)
+            if start == -1:
+                position = len(buffer)
+                break
+
+            try:
+                point, position = decoder.raw_decode(buffer, start)
+            except json.JSONDecodeError:
+                # Wait for the rest of the data point
+                position = start
+                break
+
+            yield point
+
+        buffer = buffer[position:]
+
+    if buffer:
+        raise ValueError('Incomplete JSON data point')
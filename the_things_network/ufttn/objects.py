@@ -26,5 +26,15 @@ class Device:
         endpoint = "query/{}".format(device_id)
         return session.call(endpoint, params=dict(last=last))
 
+    @classmethod
+    def iter_query(cls, session, device_id: str, last: str = None, file=None) -> iter:
+        """
+        Generate a device's data points as the response is received
+
+        :param file: Optional text file to write the raw JSON response to
+        """
+        endpoint = "query/{}".format(device_id)
+        return session.call_iter(endpoint, file=file, params=dict(last=last))
+
     def query(self, session, last: str = None):
         return self.run_query(session, device_id=self.device_id, last=last)
@@ -0,0 +1,117 @@
+"""
+Local store of data points
+
+The Data Storage integration only keeps the last seven days of data, and each query returns everything in the
+requested window. Points are saved in a local SQLite database with one record per device and time, so each run only
+needs to request the data since the newest stored point and any day's output can be built from the store.
+"""
+
+import datetime
+import json
+import logging
+import math
+import os
+import sqlite3
+
+import arrow
+
+LOGGER = logging.getLogger(__name__)
+
+# Data Storage retention period
+MAX_WINDOW = datetime.timedelta(days=7)
+
+# Extra time to request before the newest stored point (duplicate points are ignored)
+OVERLAP = datetime.timedelta(hours=1)
+
+
+class Store:
+    """
+    Data points de-duplicated by device and time
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or os.curdir, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS point (
+                device_id TEXT NOT NULL,
+                time TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (device_id, time)
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS point_time ON point (time)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM point").fetchone()[0]
+
+    def add(self, points: iter) -> int:
+        """
+        Save data points, ignoring any that are already stored
+
+        :returns: Number of new points
+        """
+        before = self.connection.total_changes
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO point (device_id, time, data) VALUES (?, ?, ?)",
+                ((point['device_id'], point['time'], json.dumps(point)) for point in points)
+            )
+
+        count = self.connection.total_changes - before
+        LOGGER.info("Stored %s new points in '%s'", count, self.path)
+
+        return count
+
+    def newest(self, device_id: str = None) -> datetime.datetime:
+        """Time of the most recent point, optionally for one device (or None if there aren't any)"""
+        if device_id is None:
+            time = self.connection.execute("SELECT MAX(time) FROM point").fetchone()[0]
+        else:
+            time = self.connection.execute(
+                "SELECT MAX(time) FROM point WHERE device_id = ?", (device_id,)).fetchone()[0]
+
+        if time is None:
+            return None
+
+        return arrow.get(time).datetime
+
+    def window(self, now: datetime.datetime = None, device_id: str = None) -> str:
+        """
+        Duration to query to retrieve all the points since the newest stored point (optionally for one device) e.g. '5h'
+        """
+        newest = self.newest(device_id=device_id)
+
+        if newest is None:
+            duration = MAX_WINDOW
+        else:
+            now = now or datetime.datetime.now(datetime.timezone.utc)
+            duration = min(now - newest + OVERLAP, MAX_WINDOW)
+
+        hours = max(math.ceil(duration.total_seconds() / 3600), 1)
+
+        return '{}h'.format(hours)
+
+    def get_date(self, date: datetime.date) -> iter:
+        """
+        Generate the data points for one day (UTC) in time order
+        """
+        start = date.isoformat()
+        end = (date + datetime.timedelta(days=1)).isoformat()
+
+        cursor = self.connection.execute(
+            "SELECT data FROM point WHERE time >= ? AND time < ? ORDER BY time, device_id", (start, end))
+
+        for data, in cursor:
+            yield json.loads(data)
@@ -1,13 +1,24 @@
 import logging
 import csv
 import datetime
-
-from collections import OrderedDict
+import functools
+import operator
+import re
 
 import arrow
 
 LOGGER = logging.getLogger(__name__)
 
+# ISO 8601 timestamp e.g. 2020-06-01T12:34:56.123456789Z
+ISO_TIMESTAMP = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?(Z|([+-])(\d{2}):?(\d{2}))?$')
+
+# Output column order (timestamp, sensor, metrics...)
+KEY_COLUMNS = ('timestamp', 'device_id')
+
+# Input fields that aren't included in the output
+DISCARD = {'raw'}
+
 
 def read_csv(path: str) -> iter:
     """
@@ -23,75 +34,135 @@ def read_csv(path: str) -> iter:
         yield from reader
 
 
-def parse(row: dict, data_types: dict) -> iter:
-    """Parse input CSV text values into native data types"""
+def parse_timestamp(timestamp: str) -> datetime.datetime:
+    a = arrow.get(timestamp)
 
-    # Map each column label to a data type
-    for label, value in row.items():
+    return a.datetime
 
-        # case-insensitive
-        label = label.casefold()
 
-        data_type = data_types[label]
+@functools.lru_cache()
+def get_timezone(sign: str, hours: str, minutes: str) -> datetime.timezone:
+    offset = datetime.timedelta(hours=int(hours), minutes=int(minutes))
+    if not offset:
+        return datetime.timezone.utc
+    return datetime.timezone(-offset if sign == '-' else offset)
 
-        try:
-            value = data_type(value)
-        except ValueError:
-            # Blank values are set to null
-            if not value:
-                value = None
-            else:
-                raise
 
-        yield label, value
+def parse_iso_timestamp(timestamp: str) -> datetime.datetime:
+    """
+    Parse an ISO 8601 timestamp, rounding fractions of a second to the nearest microsecond (the same result as
+    parse_timestamp but much faster). Other formats are parsed using arrow.
+    """
+    match = ISO_TIMESTAMP.match(timestamp)
 
+    if not match:
+        return parse_timestamp(timestamp)
 
-def parse_timestamp(timestamp: str) -> datetime.datetime:
-    a = arrow.get(timestamp)
+    year, month, day, hour, minute, second, fraction, zone, sign, offset_hours, offset_minutes = match.groups()
 
-    return a.datetime
+    if zone and sign:
+        tzinfo = get_timezone(sign, offset_hours, offset_minutes)
+    else:
+        tzinfo = datetime.timezone.utc
+
+    microsecond = 0
+    if fraction:
+        microsecond = int(fraction[:6].ljust(6, '0'))
+
+        # Round to the nearest microsecond (half to even)
+        if len(fraction) > 6:
+            seventh_digit = int(fraction[6])
+            if seventh_digit > 5 or (seventh_digit == 5 and microsecond % 2):
+                microsecond += 1
 
+    time = datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                             tzinfo=tzinfo)
 
-def transform(row: dict) -> dict:
-    # Rename
-    row['timestamp'] = row.pop('time')
+    return time + datetime.timedelta(microseconds=microsecond)
 
-    # Convert to ISO format
-    row['timestamp'] = parse_timestamp(row['timestamp'])
 
-    return row
+def get_columns(labels: iter) -> tuple:
+    """
+    Output column labels (timestamp, sensor, metrics...) with the metrics in the same order as the input fields
+
+    :param labels: Input field labels (case-insensitive) e.g. the keys of the first input row
+    """
+    labels = (label.casefold() for label in labels)
+    metrics = (label for label in labels if label not in DISCARD and label not in {'time', 'device_id'})
+    return (*KEY_COLUMNS, *metrics)
+
 
+def convert(data_type, value):
+    """Parse a value into its data type"""
+    if value is None:
+        return None
 
-def to_db(row: dict) -> dict:
+    try:
+        return data_type(value)
+    except ValueError:
+        # Blank values are set to null
+        if not value:
+            return None
+        raise
+
+
+def compile_parser(data_types: dict, columns: tuple):
     """
-    Prepare a row of data to be loaded into the UFO
+    Build a function that converts an input row (dictionary) into an output row (tuple in the order of the output
+    columns, with values parsed into their data types) and its time.
+
+    The position of each field is looked up once for each layout (sequence of field labels) of the input rows rather
+    than for each value in every row.
+
+    :param data_types: Map of input field labels (case-insensitive) to data types
+    :param columns: Output column labels (see get_columns)
     """
+    metrics = columns[len(KEY_COLUMNS):]
+    metric_types = tuple(data_types[label] for label in metrics)
+    layouts = dict()
 
-    del row['raw']
+    def compile_layout(labels: tuple):
+        # case-insensitive
+        positions = {label.casefold(): i for i, label in enumerate(labels)}
+
+        unknown = positions.keys() - data_types.keys()
+        if unknown:
+            raise KeyError(unknown.pop())
 
-    row = OrderedDict(row)
+        # Missing fields are taken from the end of the row, which is null
+        missing = len(labels)
+        return operator.itemgetter(*(positions.get(label, missing) for label in ('time', 'device_id', *metrics)))
 
-    # Re-order columns (timestamp, sensor, metrics...)
-    for key in ('device_id', 'timestamp'):
-        row.move_to_end(key, last=False)
+    def parse_row(row: dict) -> tuple:
+        labels = tuple(row)
+        try:
+            get_values = layouts[labels]
+        except KeyError:
+            get_values = layouts[labels] = compile_layout(labels)
 
-    row['timestamp'] = row['timestamp'].isoformat()
+        timestamp, device_id, *values = get_values((*row.values(), None))
 
-    LOGGER.debug(row)
+        time = parse_iso_timestamp(timestamp)
+        values = map(convert, metric_types, values)
 
-    return row
+        return time, (time.isoformat(), device_id, *values)
 
+    return parse_row
 
-def clean(rows: iter, data_types: dict, date: datetime.date) -> iter:
-    for row in rows:
-        row = dict(parse(row, data_types))
 
-        row = transform(row)
+def clean(rows: iter, data_types: dict, date: datetime.date, columns: tuple) -> iter:
+    """
+    Generate output rows (tuples in the order of the output columns) for one day
+    """
+    parse_row = compile_parser(data_types, columns=columns)
+
+    for row in rows:
+        time, row = parse_row(row)
 
         # Date filter
-        if row['timestamp'].date() != date:
+        if time.date() != date:
             continue
 
-        row = to_db(row)
+        LOGGER.debug(row)
 
         yield row
@@ -63,23 +63,16 @@ def get_headers(headers: dict) -> dict:
     return headers
 
 
-def write_csv(path: str, rows: iter, header: bool = True):
+def write_csv(path: str, rows: iter, columns: tuple, header: bool = True):
     """Serialise data in CSV format"""
 
-    writer = None
-
     with open(path, 'w', newline='') as file:
+        writer = csv.writer(file, dialect=UrbanFlowsDialect)
 
-        for row in rows:
-
-            # Initialise using headers from the first row
-            if not writer:
-                writer = csv.DictWriter(file, row.keys(), dialect=UrbanFlowsDialect)
-
-                if header:
-                    writer.writeheader()
+        if header:
+            writer.writerow(columns)
 
-            writer.writerow(row)
+        writer.writerows(rows)
 
         LOGGER.info("Wrote '%s'", file.name)
 
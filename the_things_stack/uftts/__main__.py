@@ -1,12 +1,18 @@
 import logging
 import argparse
+import pathlib
 
 import ttn
 
 from ufmetadata.assets import Site, Sensor
 
+import ingest
+import registry
+
 USAGE = """
 python uftts --app_id <my_app_id> --access_key <my_token>
+python uftts --app_id <my_app_id> --access_key <my_token> --changed
+python uftts --app_id <my_app_id> --access_key <my_token> --ingest --output <directory>
 """
 
 DESCRIPTION = """
@@ -29,6 +35,23 @@ def get_args():
     parser.add_argument('-t', '--access_key', help='Authentication token')
     parser.add_argument('-v', '--verbose', action='store_true', help='Logging debug level')
 
+    # Device registry
+    parser.add_argument('-n', '--changed', action='store_true',
+                        help='Only output assets for devices that were added or changed since the last run')
+    parser.add_argument('-r', '--registry', type=pathlib.Path,
+                        help='Device registry snapshot file path (default: ~/.cache/uftts/<app_id>.json)')
+
+    # Uplink ingestion
+    parser.add_argument('-i', '--ingest', action='store_true', help='Receive uplink messages and write them to files')
+    parser.add_argument('-o', '--output', default='data', help='Uplink data output directory')
+    parser.add_argument('-m', '--mqtt_address', default='',
+                        help='MQTT broker address host:port (default: use the application handler)')
+    parser.add_argument('-b', '--batch_size', type=int, default=ingest.DEFAULT_BATCH_SIZE,
+                        help='Number of messages to write at once')
+    parser.add_argument('-f', '--flush_interval', type=float, default=ingest.DEFAULT_FLUSH_INTERVAL,
+                        help='Maximum time to hold messages before writing them (seconds)')
+    parser.add_argument('-d', '--duration', type=float, help='Stop receiving messages after this many seconds')
+
     return parser.parse_args()
 
 
@@ -59,22 +82,47 @@ def device_to_sensor(device, app_id) -> Sensor:
     )
 
 
+def run_ingest(args):
+    """Receive uplink messages until interrupted"""
+    client = ttn.MQTTClient(args.app_id, args.access_key, mqtt_address=args.mqtt_address)
+    writer = ingest.PartitionedWriter(directory=args.output, batch_size=args.batch_size)
+
+    ingest.Ingester(writer).run(client, flush_interval=args.flush_interval, duration=args.duration)
+
+
 def main():
     args = get_args()
     logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
 
+    if args.ingest:
+        run_ingest(args)
+        return
+
     # Connect to application API
     handler = ttn.HandlerClient(app_id=args.app_id, app_access_key=args.access_key)
     app = handler.application()
 
     # List Devices
     # https://github.com/TheThingsNetwork/api/blob/master/handler/handler.proto#L91
-    for device in app.devices():
+    devices = list(app.devices())
+
+    # Compare with the previous run
+    device_registry = registry.Registry(args.registry or registry.Registry.default_path(args.app_id))
+    device_registry.load()
+    changed, _ = device_registry.update(devices)
+
+    if args.changed:
+        LOGGER.info("%s of %s devices added or changed", len(changed), len(devices))
+        devices = changed
+
+    for device in devices:
         LOGGER.info("Device '%s'", device.dev_id)
 
         print(device_to_site(device, app_id=args.app_id))
         print(device_to_sensor(device, app_id=args.app_id))
 
+    device_registry.save()
+
 
 if __name__ == '__main__':
     main()
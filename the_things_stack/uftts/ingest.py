@@ -0,0 +1,230 @@
+"""
+Receive application uplink messages in real time
+
+Uplink messages are received from the MQTT data API, decoded and buffered in memory. They're written in batches to
+output files partitioned by time (one JSON object per line) so that the data is stored without writing to disk for
+every message. The end-to-end latency (from the time the network received each message to the time it was written)
+is reported with every batch.
+
+https://www.thethingsnetwork.org/docs/applications/mqtt/api.html
+"""
+
+import base64
+import datetime
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# Output file path within the output directory (time format)
+DEFAULT_PARTITION = os.path.join('%Y', '%m', '%d', '%Y-%m-%dT%H.json')
+
+# Number of messages to write at once (the maximum number of messages held in memory)
+DEFAULT_BATCH_SIZE = 1000
+
+# Maximum time to hold messages before writing them (seconds)
+DEFAULT_FLUSH_INTERVAL = 60
+
+
+def to_dict(message) -> dict:
+    """Convert a message (the SDK returns named tuples) into plain dictionaries and lists"""
+    if hasattr(message, '_asdict'):
+        message = message._asdict()
+
+    if isinstance(message, dict):
+        return {key: to_dict(value) for key, value in message.items()}
+
+    if isinstance(message, (list, tuple)):
+        return [to_dict(value) for value in message]
+
+    return message
+
+
+def parse_time(timestamp: str) -> datetime.datetime:
+    """
+    Parse the network time e.g. 2020-06-01T12:34:56.123456789Z (fractions of a second are truncated to microseconds)
+    """
+    seconds, _, fraction = timestamp.rstrip('Z').partition('.')
+    time_ = datetime.datetime.strptime(seconds, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=datetime.timezone.utc)
+
+    return time_ + datetime.timedelta(microseconds=int(fraction[:6].ljust(6, '0')))
+
+
+def decode_uplink(message, received: datetime.datetime = None) -> tuple:
+    """
+    Convert an uplink message into a row of data
+
+    The payload fields are used if the application has a payload format (decoder), otherwise the raw payload is
+    decoded from base64 into a hexadecimal string. Payload fields with the same name as a metadata column (e.g.
+    timestamp or device_id) are ignored.
+
+    :param received: Time the message was received (default: now)
+    :returns: Time the network received the message, row
+    """
+    message = to_dict(message)
+    metadata = message.get('metadata') or dict()
+    received = received or datetime.datetime.now(datetime.timezone.utc)
+
+    row = dict(
+        timestamp=metadata.get('time') or received.isoformat(),
+        device_id=message['dev_id'],
+        port=message.get('port'),
+        counter=message.get('counter'),
+    )
+
+    fields = message.get('payload_fields')
+    if fields:
+        # Payload fields can't overwrite the message metadata
+        for key, value in fields.items():
+            row.setdefault(key, value)
+    elif message.get('payload_raw'):
+        row['payload'] = base64.b64decode(message['payload_raw']).hex()
+
+    time_ = parse_time(metadata['time']) if metadata.get('time') else received
+
+    return time_, row
+
+
+class LatencyStats:
+    """
+    Summary of the delay between messages being received by the network and being written
+    """
+
+    def __init__(self):
+        self.latencies = list()
+        self.total = 0
+
+    def add(self, latency: float):
+        self.latencies.append(latency)
+        self.total += 1
+
+    def report(self):
+        """Log a summary of the latencies since the last report and reset"""
+        if not self.latencies:
+            return
+
+        latencies = sorted(self.latencies)
+        LOGGER.info("Latency over %s messages (%s total): median %.3fs, 95th percentile %.3fs, max %.3fs",
+                    len(latencies), self.total, statistics.median(latencies),
+                    latencies[int(0.95 * (len(latencies) - 1))], latencies[-1])
+
+        self.latencies = list()
+
+
+class PartitionedWriter:
+    """
+    Buffer rows in memory and append them in batches to output files partitioned by time
+    """
+
+    def __init__(self, directory: str, partition: str = DEFAULT_PARTITION, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        :param directory: Output directory
+        :param partition: Output file path format (strftime) for the time of each row
+        :param batch_size: Write when this many rows are buffered
+        """
+        self.directory = directory
+        self.partition = partition
+        self.batch_size = batch_size
+
+        # Rows waiting to be written, grouped by output file
+        self.buffer = dict()
+        self.buffered = 0
+
+        self.latency = LatencyStats()
+        self._lock = threading.Lock()
+
+    def path(self, time_: datetime.datetime) -> str:
+        return os.path.join(self.directory, time_.strftime(self.partition))
+
+    def add(self, time_: datetime.datetime, row: dict):
+        """
+        :param time_: Time the network received the message (used to choose the output file)
+        """
+        with self._lock:
+            self.buffer.setdefault(self.path(time_), list()).append((time_, row))
+            self.buffered += 1
+
+            if self.buffered >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffered:
+            return
+
+        for path, rows in self.buffer.items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            with open(path, 'a') as file:
+                for _, row in rows:
+                    file.write(json.dumps(row))
+                    file.write('\n')
+
+            LOGGER.debug("Wrote %s rows to '%s'", len(rows), path)
+
+        # End-to-end latency
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for rows in self.buffer.values():
+            for time_, _ in rows:
+                self.latency.add((now - time_).total_seconds())
+
+        LOGGER.info("Wrote %s rows to %s files", self.buffered, len(self.buffer))
+        self.latency.report()
+
+        self.buffer = dict()
+        self.buffered = 0
+
+
+class Ingester:
+    """
+    Receive uplink messages from an MQTT client and write them to partitioned files
+    """
+
+    def __init__(self, writer: PartitionedWriter):
+        self.writer = writer
+        self.count = 0
+
+    def on_uplink(self, message, client=None):
+        """Uplink callback (called by the MQTT client thread)"""
+        try:
+            time_, row = decode_uplink(message)
+        except (KeyError, ValueError, TypeError) as error:
+            LOGGER.error("Failed to decode uplink message: %s", error)
+            LOGGER.debug(message)
+            return
+
+        LOGGER.debug(row)
+
+        self.writer.add(time_, row)
+        self.count += 1
+
+    def run(self, client, flush_interval: float = DEFAULT_FLUSH_INTERVAL, duration: float = None):
+        """
+        Receive messages until interrupted, writing the buffer at regular intervals
+
+        :param client: ttn.MQTTClient or another client with the same interface
+        :param duration: Stop after this many seconds (default: run forever)
+        """
+        client.set_uplink_callback(self.on_uplink)
+        client.connect()
+        LOGGER.info("Listening for uplink messages...")
+
+        stop = time.monotonic() + duration if duration is not None else None
+        try:
+            while stop is None or time.monotonic() < stop:
+                time.sleep(flush_interval if stop is None else max(min(flush_interval, stop - time.monotonic()), 0))
+                self.writer.flush()
+        except KeyboardInterrupt:
+            LOGGER.info("Stopping")
+        finally:
+            client.close()
+            self.writer.flush()
+
+        LOGGER.info("Received %s uplink messages", self.count)
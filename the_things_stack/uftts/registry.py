@@ -0,0 +1,87 @@
+"""
+Local snapshot of an application's devices
+
+The device properties that are used to generate the assets are saved in a JSON file after each run so that the next run
+can find which devices have been added or changed since then.
+"""
+
+import json
+import logging
+import os
+import pathlib
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_DIR = pathlib.Path.home().joinpath('.cache', 'uftts')
+
+# Device properties that device_to_site() and device_to_sensor() read
+FIELDS = ('dev_id', 'latitude', 'longitude', 'altitude')
+
+
+def device_to_record(device) -> dict:
+    """Device properties (JSON-serialisable)"""
+    return {field: getattr(device, field, None) for field in FIELDS}
+
+
+class Registry:
+    """
+    Devices from the previous run, identified by device ID
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        self.devices = dict()
+
+    @classmethod
+    def default_path(cls, app_id: str) -> pathlib.Path:
+        return DEFAULT_DIR.joinpath('{}.json'.format(app_id))
+
+    def load(self):
+        try:
+            with self.path.open() as file:
+                self.devices = json.load(file)
+        except FileNotFoundError:
+            LOGGER.info("No device registry at '%s'", self.path)
+            return
+
+        LOGGER.info("Loaded %s devices from '%s'", len(self.devices), self.path)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with temp_path.open('w') as file:
+            json.dump(self.devices, file, indent=2, sort_keys=True)
+
+        # Only swap in the complete file, so a crash can't leave a registry that fails to load
+        os.replace(str(temp_path), str(self.path))
+
+        LOGGER.info("Saved %s devices to '%s'", len(self.devices), self.path)
+
+    def update(self, devices) -> tuple:
+        """
+        Replace the snapshot with the current devices
+
+        :returns: Devices that were added or changed, IDs of devices that were removed
+        """
+        current = dict()
+        changed = list()
+
+        for device in devices:
+            record = device_to_record(device)
+            current[record['dev_id']] = record
+
+            previous = self.devices.get(record['dev_id'])
+            if previous is None:
+                LOGGER.info("New device '%s'", record['dev_id'])
+                changed.append(device)
+            elif previous != record:
+                LOGGER.info("Changed device '%s'", record['dev_id'])
+                changed.append(device)
+
+        removed = sorted(self.devices.keys() - current.keys())
+        for dev_id in removed:
+            LOGGER.warning("Device '%s' no longer exists", dev_id)
+
+        self.devices = current
+
+        return changed, removed
@@ -0,0 +1,111 @@
+import collections
+import json
+import os
+import tempfile
+import unittest
+
+import ingest
+
+# The SDK returns uplink messages as named tuples
+UplinkMessage = collections.namedtuple('UplinkMessage', ('app_id', 'dev_id', 'port', 'counter', 'payload_raw',
+                                                         'payload_fields', 'metadata'))
+Metadata = collections.namedtuple('Metadata', ('time',))
+
+
+def build_message(time: str, counter: int = 0, payload_fields: dict = None) -> UplinkMessage:
+    return UplinkMessage(app_id='test', dev_id='my-device', port=1, counter=counter, payload_raw='AQID',
+                         payload_fields=payload_fields, metadata=Metadata(time=time))
+
+
+class FakeClient:
+    """MQTT client that delivers a list of messages when it connects"""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.callback = None
+        self.closed = False
+
+    def set_uplink_callback(self, callback):
+        self.callback = callback
+
+    def connect(self):
+        for message in self.messages:
+            self.callback(message, self)
+
+    def close(self):
+        self.closed = True
+
+
+class TestIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read(self, *path) -> list:
+        with open(os.path.join(self.directory.name, *path)) as file:
+            return [json.loads(line) for line in file]
+
+    def test_decode_raw_payload(self):
+        time_, row = ingest.decode_uplink(build_message('2020-06-01T12:00:00.123456789Z'))
+
+        self.assertEqual(time_.isoformat(), '2020-06-01T12:00:00.123456+00:00')
+        self.assertEqual(row, dict(timestamp='2020-06-01T12:00:00.123456789Z', device_id='my-device', port=1,
+                                   counter=0, payload='010203'))
+
+    def test_payload_fields_do_not_overwrite_metadata(self):
+        message = build_message('2020-06-01T12:00:00Z', payload_fields=dict(
+            timestamp='1970-01-01T00:00:00Z', device_id='other', temperature=21.5))
+        _, row = ingest.decode_uplink(message)
+
+        self.assertEqual(row['timestamp'], '2020-06-01T12:00:00Z')
+        self.assertEqual(row['device_id'], 'my-device')
+        self.assertEqual(row['temperature'], 21.5)
+
+    def test_batches_are_bounded(self):
+        writer = ingest.PartitionedWriter(self.directory.name, batch_size=2)
+        path = os.path.join('2020', '06', '01', '2020-06-01T12.json')
+
+        for counter in range(3):
+            writer.add(*ingest.decode_uplink(build_message('2020-06-01T12:00:0{}Z'.format(counter), counter)))
+            self.assertLess(writer.buffered, writer.batch_size)
+
+        # The first batch was written when it was full
+        self.assertEqual([row['counter'] for row in self.read(path)], [0, 1])
+        self.assertEqual(writer.buffered, 1)
+
+        writer.flush()
+        self.assertEqual([row['counter'] for row in self.read(path)], [0, 1, 2])
+        self.assertEqual(writer.buffered, 0)
+
+    def test_ingester_writes_partitioned_files(self):
+        client = FakeClient([
+            build_message('2020-06-01T12:59:59Z', counter=0),
+            build_message('2020-06-01T13:00:00Z', counter=1),
+            build_message('2020-06-02T00:00:00Z', counter=2),
+        ])
+        ingester = ingest.Ingester(ingest.PartitionedWriter(self.directory.name, batch_size=100))
+
+        ingester.run(client, flush_interval=0, duration=0)
+
+        self.assertTrue(client.closed)
+        self.assertEqual(ingester.count, 3)
+        self.assertEqual([row['counter'] for row in self.read('2020', '06', '01', '2020-06-01T12.json')], [0])
+        self.assertEqual([row['counter'] for row in self.read('2020', '06', '01', '2020-06-01T13.json')], [1])
+        self.assertEqual([row['counter'] for row in self.read('2020', '06', '02', '2020-06-02T00.json')], [2])
+
+    def test_invalid_messages_are_skipped(self):
+        client = FakeClient([dict(port=1), build_message('2020-06-01T12:00:00Z')])
+        ingester = ingest.Ingester(ingest.PartitionedWriter(self.directory.name))
+
+        with self.assertLogs(ingest.LOGGER, 'ERROR'):
+            ingester.run(client, flush_interval=0, duration=0)
+
+        self.assertEqual(ingester.count, 1)
+        self.assertEqual(len(self.read('2020', '06', '01', '2020-06-01T12.json')), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()